@@ -0,0 +1,46 @@
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, TypeHandler
+
+class AdminGuard:
+    """
+    Filtro previo a todos los handlers que descarta las actualizaciones de
+    usuarios que no son administradores. Se registra en un grupo anterior al
+    de los handlers del bot, de modo que el tráfico no autorizado no llega a
+    consultar la base de datos ni a responder callbacks.
+    Solo /start (canje de tokens VIP) y las solicitudes de ingreso a canales
+    están abiertas a cualquier usuario.
+    """
+
+    GROUP = -1
+
+    def __init__(self, admin_ids):
+        """
+        Args:
+            admin_ids (iterable): IDs de Telegram de los administradores
+        """
+        self.admin_ids = frozenset(admin_ids)
+
+    def is_admin(self, user_id):
+        return user_id in self.admin_ids
+
+    @staticmethod
+    def is_public(update):
+        if update.chat_join_request:
+            return True
+        message = update.message
+        if message and message.text:
+            command = message.text.split(maxsplit=1)[0]
+            return command == '/start' or command.startswith('/start@')
+        return False
+
+    async def check(self, update, context):
+        if self.is_public(update):
+            return
+        user = update.effective_user
+        if user and self.is_admin(user.id):
+            return
+        raise ApplicationHandlerStop
+
+    def handler(self):
+        """TypeHandler que debe registrarse en el grupo AdminGuard.GROUP"""
+        return TypeHandler(Update, self.check)
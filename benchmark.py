@@ -0,0 +1,242 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+from database import ConnectionPool, StorageProfile
+
+# Perfil equivalente al comportamiento anterior: rollback journal y valores por defecto de SQLite
+LEGACY_PROFILE = StorageProfile(
+    journal_mode='DELETE',
+    synchronous='FULL',
+    cache_size=-2000,
+    mmap_size=0,
+    busy_timeout=5000,
+    temp_store='DEFAULT'
+)
+
+def _seed_vip_users(pool, count):
+    now = int(time.time())
+    with pool.transaction() as conn:
+        conn.execute('''
+            CREATE TABLE vip_users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                subscription_end INTEGER,
+                status TEXT DEFAULT 'active'
+            )
+        ''')
+        conn.executemany(
+            'INSERT INTO vip_users (user_id, username, subscription_end) VALUES (?, ?, ?)',
+            [(i, f"user{i}", now + i * 60) for i in range(count)]
+        )
+
+def bench_storage(profile, readers=4, duration=3.0, rows=5000):
+    """
+    Lectores concurrentes consultando vip_users mientras un escritor
+    actualiza estados, como check_subscriptions frente a los handlers.
+
+    Returns:
+        dict: lecturas/s, escrituras/s y errores por bloqueo
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = ConnectionPool(os.path.join(tmp, 'bench.sqlite'), size=readers + 1, profile=profile)
+        _seed_vip_users(pool, rows)
+
+        stop = threading.Event()
+        counters = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def reader():
+            reads = errors = 0
+            while not stop.is_set():
+                try:
+                    with pool.connection() as conn:
+                        conn.execute(
+                            "SELECT COUNT(*) FROM vip_users WHERE status = 'active' AND subscription_end > ?",
+                            (int(time.time()),)
+                        ).fetchone()
+                    reads += 1
+                except Exception:
+                    errors += 1
+            with lock:
+                counters['reads'] += reads
+                counters['errors'] += errors
+
+        def writer():
+            writes = errors = 0
+            while not stop.is_set():
+                try:
+                    with pool.transaction() as conn:
+                        conn.execute(
+                            "UPDATE vip_users SET status = CASE status WHEN 'active' THEN 'expired' ELSE 'active' END WHERE user_id = ?",
+                            (writes % rows,)
+                        )
+                    writes += 1
+                except Exception:
+                    errors += 1
+            with lock:
+                counters['writes'] += writes
+                counters['errors'] += errors
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads.append(threading.Thread(target=writer))
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        pool.close()
+
+    return {
+        'reads_per_sec': counters['reads'] / duration,
+        'writes_per_sec': counters['writes'] / duration,
+        'errors': counters['errors']
+    }
+
+def run_storage():
+    print("Benchmark de almacenamiento (lectores concurrentes + 1 escritor)")
+    for label, profile in (("Antes (DELETE/FULL)", LEGACY_PROFILE), ("Después (WAL/NORMAL)", StorageProfile())):
+        result = bench_storage(profile)
+        print(
+            f"  {label}: {result['reads_per_sec']:.0f} lecturas/s, "
+            f"{result['writes_per_sec']:.0f} escrituras/s, {result['errors']} errores"
+        )
+
+def _temp_admin_bot(tmp):
+    # AdminBot lee DATABASE_PATH al construirse; load_dotenv no sobrescribe variables ya definidas
+    os.environ['DATABASE_PATH'] = os.path.join(tmp, 'bench.sqlite')
+    from bot import AdminBot
+    return AdminBot()
+
+def bench_free_requests(count=10000):
+    """
+    Inserta y marca como procesadas `count` solicitudes del canal gratuito,
+    fila a fila (una transacción por solicitud) y en lote.
+
+    Returns:
+        dict: segundos de cada fase por estrategia
+    """
+    requests = [(user_id, f"user{user_id}", -100) for user_id in range(count)]
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        admin_bot = _temp_admin_bot(tmp)
+
+        started = time.perf_counter()
+        for user_id, username, chat_id in requests:
+            admin_bot.add_free_channel_request(user_id, username, chat_id)
+        inserted = time.perf_counter()
+        for request_id, user_id, username, requested_at, chat_id in admin_bot.get_pending_free_requests():
+            # Estrategia anterior: una transacción por solicitud
+            with admin_bot.db.transaction() as conn:
+                conn.execute('UPDATE free_channel_requests SET processed = TRUE WHERE id = ?', (request_id,))
+        results['row'] = (inserted - started, time.perf_counter() - inserted)
+        admin_bot.db.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        admin_bot = _temp_admin_bot(tmp)
+
+        started = time.perf_counter()
+        admin_bot.add_free_channel_requests(requests)
+        inserted = time.perf_counter()
+        admin_bot.mark_requests_processed([request[0] for request in admin_bot.get_pending_free_requests()])
+        results['batch'] = (inserted - started, time.perf_counter() - inserted)
+        admin_bot.db.close()
+
+    return results
+
+def run_free_requests():
+    print("Benchmark de solicitudes del canal gratuito (10k solicitudes)")
+    results = bench_free_requests()
+    for label, key in (("Fila a fila", 'row'), ("En lote", 'batch')):
+        insert_time, mark_time = results[key]
+        print(f"  {label}: inserción {insert_time:.2f}s, marcado {mark_time:.2f}s")
+
+# Patrones de la lista de CallbackQueryHandler anterior al CallbackRouter, en el mismo orden
+LEGACY_CALLBACK_PATTERNS = [
+    "^admin_panel$", "^admin_vip$", "^admin_free$", "^admin_stats$", "^admin_config$",
+    "^config_delay$", "^set_delay_", "^generate_vip_token$", "^generate_token_rate_",
+    "^view_vip_users$", "^manage_channels$", "^add_free_channel$", "^add_vip_channel$",
+    "^view_channels$", "^system_config$", "^vip_management$", "^statistics$",
+    "^manage_rates$", "^select_rate_duration$", "^rate_duration_", "^view_rates$",
+    "^edit_rate_", "^toggle_rate_status_", "^delete_rate_", "^confirm_delete_rate_",
+    "^change_rate_name_", "^change_rate_duration_", "^change_rate_cost_",
+    "^send_to_vip_channel$", "^send_to_free_channel$", "^(attach_file|no_file)$",
+    "^(disable_downloads|allow_downloads)$", "^(confirm_send_message|edit_message)$",
+]
+
+def _callback_update(data):
+    from telegram import CallbackQuery, Update, User
+    user = User(id=1, first_name='admin', is_bot=False)
+    return Update(update_id=1, callback_query=CallbackQuery(id='1', from_user=user, chat_instance='1', data=data))
+
+def bench_callback_dispatch(iterations=20000):
+    """
+    Resolución del handler de una pulsación: lista de CallbackQueryHandler con
+    regex (evaluados en orden, como hace Application) frente al CallbackRouter
+    a través de su CallbackQueryHandler registrado (check_update + resolve).
+
+    Returns:
+        dict: microsegundos por pulsación de cada estrategia
+    """
+    from telegram.ext import CallbackQueryHandler
+    from callback_router import CallbackRouter, encode_callback
+
+    async def noop(update, context):
+        pass
+
+    handlers = [CallbackQueryHandler(noop, pattern=pattern) for pattern in LEGACY_CALLBACK_PATTERNS]
+    legacy_data = ["admin_panel", "set_delay_60", "view_rates", "edit_rate_3", "change_rate_cost_3", "edit_message"]
+
+    router = CallbackRouter({pattern.strip('^$_'): noop for pattern in LEGACY_CALLBACK_PATTERNS if '(' not in pattern})
+    for action in ('attach_file', 'no_file', 'disable_downloads', 'allow_downloads', 'confirm_send_message', 'edit_message'):
+        router.register(action, noop)
+    router_data = ["admin_panel", encode_callback('set_delay', 60), "view_rates",
+                   encode_callback('edit_rate', 3), encode_callback('change_rate_cost', 3), "edit_message"]
+
+    legacy_updates = [_callback_update(data) for data in legacy_data]
+    router_updates = [_callback_update(data) for data in router_data]
+    router_handler = router.handler()
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        update = legacy_updates[i % len(legacy_updates)]
+        for handler in handlers:
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                break
+    legacy_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        update = router_updates[i % len(router_updates)]
+        if router_handler.check_update(update):
+            callback, args = router.resolve(update.callback_query.data)
+    router_time = time.perf_counter() - started
+
+    return {
+        'handlers_us': legacy_time / iterations * 1e6,
+        'router_us': router_time / iterations * 1e6,
+    }
+
+def run_callback_dispatch():
+    print("Benchmark de despacho de botones inline")
+    result = bench_callback_dispatch()
+    print(f"  Lista de CallbackQueryHandler: {result['handlers_us']:.1f} µs/pulsación")
+    print(f"  CallbackRouter: {result['router_us']:.2f} µs/pulsación")
+
+BENCHMARKS = {
+    'storage': run_storage,
+    'free_requests': run_free_requests,
+    'callback_dispatch': run_callback_dispatch,
+}
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        if name not in BENCHMARKS:
+            print(f"Benchmark desconocido: {name}. Disponibles: {', '.join(BENCHMARKS)}")
+            continue
+        BENCHMARKS[name]()
@@ -1,406 +1,777 @@
 import os
-import sqlite3
 import asyncio
+import functools
+import json
+import time
 import uuid
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from dotenv import load_dotenv
+from database import ConnectionPool, StorageProfile
+from cache import ConfigCache, ChannelRegistry
+from migrations import SCHEMA_VERSION, get_schema_version, migrate
 
 load_dotenv()
 
+EXPIRE_SUBSCRIPTIONS_SQL = '''
+    UPDATE vip_users 
+    SET status = 'expired' 
+    WHERE status = 'active' AND subscription_end <= ?
+    RETURNING user_id
+'''
+
+PENDING_FREE_REQUESTS_SQL = '''
+    SELECT id, user_id, username, requested_at, chat_id 
+    FROM free_channel_requests 
+    WHERE processed = FALSE
+'''
+
+DUE_FREE_REQUESTS_SQL = '''
+    SELECT id, user_id, username, requested_at, chat_id 
+    FROM free_channel_requests 
+    WHERE processed = FALSE AND requested_at <= ?
+    ORDER BY requested_at
+    LIMIT ?
+'''
+
+NEXT_FREE_REQUEST_SQL = '''
+    SELECT MIN(requested_at) 
+    FROM free_channel_requests 
+    WHERE processed = FALSE AND requested_at > ?
+'''
+
+# Páginas de vip_users por clave (subscription_end, user_id): cada página es una consulta
+# de tamaño fijo, sin OFFSET, sin importar cuántos suscriptores haya. Un subscription_end
+# NULL (filas antiguas) ordena como 0: sin COALESCE la comparación sería NULL y esas filas
+# no aparecerían en ninguna página. El rango sobre el primer término permite a SQLite
+# posicionarse en el índice de expresión; la comparación por filas resuelve los empates
+VIP_USERS_PAGE_SQL = '''
+    SELECT user_id, username, subscription_end, status 
+    FROM vip_users 
+    WHERE {status_filter}COALESCE(subscription_end, 0) {operator}= ?
+        AND (COALESCE(subscription_end, 0), user_id) {operator} (?, ?)
+    ORDER BY COALESCE(subscription_end, 0) {order}, user_id {order}
+    LIMIT ?
+'''
+
+def vip_users_page_sql(status=None, backwards=False):
+    return VIP_USERS_PAGE_SQL.format(
+        status_filter='status = ? AND ' if status else '',
+        operator='<' if backwards else '>',
+        order='DESC' if backwards else 'ASC'
+    )
+
+# Audiencias de las difusiones sobre vip_users (:now y :window en segundos epoch)
+BROADCAST_AUDIENCES = {
+    'active': "status = 'active' AND subscription_end > :now AND blocked_at IS NULL",
+    'expiring': "status = 'active' AND subscription_end BETWEEN :now AND :now + :window AND blocked_at IS NULL",
+    'expired': "status = 'expired' AND blocked_at IS NULL",
+}
+
+PENDING_BROADCAST_RECIPIENTS_SQL = '''
+    SELECT user_id 
+    FROM broadcast_recipients 
+    WHERE broadcast_id = ? AND status = 'pending'
+    ORDER BY user_id
+    LIMIT ?
+'''
+
+# Reserva mensajes vencidos de la cola: next_attempt_at pasa a ser el fin del arriendo,
+# de modo que un envío interrumpido por un reinicio se reintenta al expirar
+CLAIM_DUE_OUTBOX_SQL = '''
+    UPDATE outbox 
+    SET next_attempt_at = ? 
+    WHERE id IN (
+        SELECT id FROM outbox 
+        WHERE status = 'pending' AND next_attempt_at <= ? 
+        ORDER BY next_attempt_at 
+        LIMIT ?
+    )
+    RETURNING id, kind, chat_id, payload, attempts
+'''
+
+SCHEDULED_DRAFTS_SQL = '''
+    SELECT id, channel_type, send_at 
+    FROM message_drafts 
+    WHERE send_at IS NOT NULL
+    ORDER BY send_at
+'''
+
+NEXT_OUTBOX_SQL = '''
+    SELECT MIN(next_attempt_at) 
+    FROM outbox 
+    WHERE status = 'pending'
+'''
+
+def format_timestamp(timestamp, fmt='%Y-%m-%d %H:%M'):
+    """Formatea una marca de tiempo epoch en hora local"""
+    if timestamp is None:
+        return '-'
+    return datetime.fromtimestamp(timestamp).strftime(fmt)
+
+async def send_content(bot, chat_id, message_text, file_id=None, file_type=None, disable_downloads=False):
+    """
+    Envía un mensaje de texto, o un archivo con el texto como pie, a un chat.
+    Los errores de Telegram se propagan al llamador.
+    
+    Args:
+        bot (Bot): Bot de Telegram
+        chat_id (int): Chat o canal de destino
+        message_text (str): Texto del mensaje (HTML)
+        file_id (str, optional): ID del archivo en Telegram
+        file_type (str, optional): Tipo de archivo ('photo', 'video', 'document')
+        disable_downloads (bool): Si proteger el contenido contra reenvíos y descargas
+    """
+    if file_id and file_type:
+        # Enviar mensaje con archivo adjunto usando file_id
+        kwargs = {
+            "chat_id": chat_id,
+            "caption": message_text,
+            "parse_mode": 'HTML',
+            "protect_content": disable_downloads
+        }
+        
+        if file_type == 'photo':
+            return await bot.send_photo(photo=file_id, **kwargs)
+        if file_type == 'video':
+            return await bot.send_video(video=file_id, **kwargs)
+        # Documentos y fallback para tipos desconocidos
+        return await bot.send_document(document=file_id, **kwargs)
+    
+    # Enviar solo texto
+    return await bot.send_message(
+        chat_id=chat_id,
+        text=message_text,
+        parse_mode='HTML',
+        protect_content=disable_downloads
+    )
+
+# Consultas de los caminos calientes con parámetros de ejemplo para EXPLAIN QUERY PLAN
+HOT_QUERIES = {
+    'expire_old_subscriptions': (EXPIRE_SUBSCRIPTIONS_SQL, (0,)),
+    'get_pending_free_requests': (PENDING_FREE_REQUESTS_SQL, ()),
+    'get_due_free_requests': (DUE_FREE_REQUESTS_SQL, (0, 100)),
+    'get_next_free_request_time': (NEXT_FREE_REQUEST_SQL, (0,)),
+    'get_pending_broadcast_recipients': (PENDING_BROADCAST_RECIPIENTS_SQL, (1, 500)),
+    'claim_outbox': (CLAIM_DUE_OUTBOX_SQL, (0, 0, 100)),
+    'get_next_outbox_time': (NEXT_OUTBOX_SQL, ()),
+    'get_scheduled_drafts': (SCHEDULED_DRAFTS_SQL, ()),
+    'get_vip_users_page': (vip_users_page_sql(), (0, 0, 0, 11)),
+    'get_vip_users_page_backwards': (vip_users_page_sql(backwards=True), (0, 0, 0, 11)),
+    'get_vip_users_page_status': (vip_users_page_sql('active'), ('active', 0, 0, 0, 11)),
+    'get_vip_users_page_status_backwards': (vip_users_page_sql('active', True), ('active', 0, 0, 0, 11)),
+}
+
 class AdminBot:
     def __init__(self):
         self.token = os.getenv('BOT_TOKEN')
         admin_id_str = os.getenv('ADMIN_ID')
         self.admin_id = int(admin_id_str) if admin_id_str else 0
+        # ADMIN_IDS admite varios administradores separados por comas, además de ADMIN_ID
+        self.admin_ids = {int(value) for value in os.getenv('ADMIN_IDS', '').split(',') if value.strip()}
+        if self.admin_id:
+            self.admin_ids.add(self.admin_id)
         self.database_path = os.getenv('DATABASE_PATH', './database.sqlite')
+        self.storage_profile = StorageProfile.from_env()
+        self.db = ConnectionPool(
+            self.database_path,
+            size=int(os.getenv('DB_POOL_SIZE', '4')),
+            profile=self.storage_profile
+        )
         self.init_database()
+        self.config = ConfigCache(self.db)
+        self.config.load()
+        self.channels = ChannelRegistry(self.db)
+        self.channels.load()
+        # Se incrementa en cada cambio de vip_rates; invalida los menús construidos con tarifas
+        self.rates_version = 0
 
     def init_database(self):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
+        # La primera conexión del pool aplica el perfil de almacenamiento (WAL, PRAGMAs)
+        with self.db.connection() as conn:
+            if get_schema_version(conn) == SCHEMA_VERSION:
+                return
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS config (
-                key TEXT PRIMARY KEY,
-                value TEXT
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS vip_tokens (
-                token TEXT PRIMARY KEY,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                used BOOLEAN DEFAULT FALSE,
-                duration_days INTEGER DEFAULT 30
-            )
-        ''')
-        
-        # Add duration_days column if it doesn't exist (for existing databases)
-        cursor.execute("PRAGMA table_info(vip_tokens)")
-        columns = [column[1] for column in cursor.fetchall()]
-        if 'duration_days' not in columns:
-            cursor.execute('ALTER TABLE vip_tokens ADD COLUMN duration_days INTEGER DEFAULT 30')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS vip_users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                subscription_end TIMESTAMP,
-                status TEXT DEFAULT 'active'
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS free_channel_requests (
-                user_id INTEGER,
-                username TEXT,
-                requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                processed BOOLEAN DEFAULT FALSE,
-                PRIMARY KEY (user_id, requested_at)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS channels (
-                channel_id INTEGER PRIMARY KEY,
-                channel_name TEXT,
-                channel_type TEXT CHECK(channel_type IN ('free', 'vip')),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT TRUE
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS vip_rates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                days INTEGER NOT NULL,
-                cost REAL NOT NULL,
-                is_active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        with self.db.transaction() as conn:
+            applied = migrate(conn)
+        if applied:
+            print(f"Migraciones aplicadas: {applied}")
+
+    def explain_hot_queries(self):
+        """
+        Obtiene el plan de ejecución de cada consulta frecuente.
         
-        cursor.execute('''
-            INSERT OR IGNORE INTO config (key, value) VALUES ('free_channel_delay', '60')
-        ''')
+        Returns:
+            dict: {nombre: [detalle del plan, ...]}
+        """
+        plans = {}
+        with self.db.connection() as conn:
+            for name, (sql, params) in HOT_QUERIES.items():
+                rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+                plans[name] = [row[3] for row in rows]
+        return plans
+
+    def verify_query_plans(self):
+        """
+        Comprueba que ninguna consulta frecuente recorra una tabla completa.
         
-        conn.commit()
-        conn.close()
+        Raises:
+            RuntimeError: Si alguna consulta hace un SCAN sin usar índice
+        """
+        regressions = []
+        for name, details in self.explain_hot_queries().items():
+            for detail in details:
+                if detail.startswith('SCAN') and 'INDEX' not in detail:
+                    regressions.append(f"{name}: {detail}")
+        if regressions:
+            raise RuntimeError("Consultas sin índice:\n" + "\n".join(regressions))
 
     def get_free_channel_delay(self):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT value FROM config WHERE key = "free_channel_delay"')
-        result = cursor.fetchone()
-        conn.close()
-        return int(result[0]) if result else 60
+        return self.config.get_int('free_channel_delay', 60)
 
     def set_free_channel_delay(self, delay_seconds):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE config SET value = ? WHERE key = "free_channel_delay"', (str(delay_seconds),))
-        conn.commit()
-        conn.close()
+        self.config.set('free_channel_delay', int(delay_seconds))
 
     def generate_vip_token(self, duration_days=30):
         token = str(uuid.uuid4())
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO vip_tokens (token, duration_days) VALUES (?, ?)', (token, duration_days))
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as conn:
+            conn.execute('INSERT INTO vip_tokens (token, duration_days) VALUES (?, ?)', (token, duration_days))
         return token
 
-
-
     def validate_vip_token(self, token):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM vip_tokens WHERE token = ? AND used = FALSE', (token,))
-        token_data = cursor.fetchone()
-        conn.close()
+        with self.db.connection() as conn:
+            token_data = conn.execute('SELECT * FROM vip_tokens WHERE token = ? AND used = FALSE', (token,)).fetchone()
         return token_data is not None
 
+    def get_token_duration(self, token):
+        with self.db.connection() as conn:
+            token_data = conn.execute('SELECT duration_days FROM vip_tokens WHERE token = ?', (token,)).fetchone()
+        return token_data[0] if token_data and token_data[0] else 30
+
     def register_vip_user(self, user_id, username, token):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        
-        # Obtener la duración del token
-        cursor.execute('SELECT duration_days FROM vip_tokens WHERE token = ?', (token,))
-        token_data = cursor.fetchone()
-        duration_days = token_data[0] or 30  # Usar 30 días como valor por defecto
-        
-        subscription_end = datetime.now() + timedelta(days=duration_days)
-        cursor.execute('''
-            INSERT OR REPLACE INTO vip_users (user_id, username, subscription_end, status)
-            VALUES (?, ?, ?, 'active')
-        ''', (user_id, username, subscription_end))
-        
-        cursor.execute('UPDATE vip_tokens SET used = TRUE WHERE token = ?', (token,))
-        conn.commit()
-        conn.close()
-
-    def get_vip_users(self):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT user_id, username, subscription_end, status FROM vip_users ORDER BY subscription_end')
-        users = cursor.fetchall()
-        conn.close()
-        return users
-
-    def get_expiring_vip_users(self):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        
-        now = datetime.now()
-        tomorrow = now + timedelta(days=1)
-        
-        cursor.execute('''
-            SELECT user_id, username, subscription_end 
-            FROM vip_users 
-            WHERE status = 'active' AND subscription_end BETWEEN ? AND ?
-        ''', (now, tomorrow))
-        
-        users = cursor.fetchall()
-        conn.close()
-        return users
-
-    def expire_old_subscriptions(self):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        
-        now = datetime.now()
-        cursor.execute('''
-            UPDATE vip_users 
-            SET status = 'expired' 
-            WHERE status = 'active' AND subscription_end < ?
-        ''', (now,))
-        
-        conn.commit()
-        conn.close()
-
-    def add_free_channel_request(self, user_id, username):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO free_channel_requests (user_id, username)
-            VALUES (?, ?)
-        ''', (user_id, username))
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as conn:
+            # Obtener la duración del token
+            duration_days = self.get_token_duration(token)
+            
+            subscription_end = int(time.time()) + duration_days * 86400
+            # Reemplazar la fila reinicia reminded_at y blocked_at para el nuevo periodo
+            conn.execute('''
+                INSERT OR REPLACE INTO vip_users (user_id, username, subscription_end, status)
+                VALUES (?, ?, ?, 'active')
+            ''', (user_id, username, subscription_end))
+            
+            conn.execute('UPDATE vip_tokens SET used = TRUE WHERE token = ?', (token,))
+        
+        return subscription_end
+
+    def get_vip_users_page(self, status=None, after=None, before=None, limit=10):
+        """
+        Obtiene una página de usuarios VIP ordenados por (subscription_end, user_id).
+        
+        Args:
+            status (str, optional): Filtrar por estado ('active', 'expired'); None para todos
+            after (tuple, optional): Clave (subscription_end, user_id) tras la que empieza la página
+            before (tuple, optional): Clave (subscription_end, user_id) antes de la que termina la página
+                (subscription_end 0 para los usuarios sin fecha)
+            limit (int): Usuarios por página
+            
+        Returns:
+            tuple: (usuarios, hay_anterior, hay_siguiente); cada usuario es
+                (user_id, username, subscription_end, status)
+        """
+        backwards = before is not None
+        # Primera página: clave menor que cualquier subscription_end
+        cursor = before if backwards else (after or (-1, -1))
+        params = ((status,) if status else ()) + (cursor[0],) + tuple(cursor) + (limit + 1,)
+        
+        with self.db.connection() as conn:
+            users = conn.execute(vip_users_page_sql(status, backwards), params).fetchall()
+        
+        has_more = len(users) > limit
+        users = users[:limit]
+        if backwards:
+            users.reverse()
+            return users, has_more, True
+        return users, after is not None, has_more
+
+    def get_active_vip_subscriptions(self):
+        with self.db.connection() as conn:
+            return conn.execute('''
+                SELECT user_id, username, subscription_end
+                FROM vip_users
+                WHERE status = 'active'
+            ''').fetchall()
+
+    def get_active_subscription_ends(self, user_ids):
+        """
+        Returns:
+            dict: {user_id: subscription_end} de los usuarios indicados que siguen activos
+        """
+        if not user_ids:
+            return {}
+        with self.db.connection() as conn:
+            return dict(conn.execute(f'''
+                SELECT user_id, subscription_end
+                FROM vip_users
+                WHERE status = 'active' AND user_id IN ({', '.join('?' * len(user_ids))})
+            ''', list(user_ids)).fetchall())
+
+    def expire_old_subscriptions(self, now=None):
+        """
+        Marca como expiradas las suscripciones vencidas.
+        
+        Args:
+            now (float, optional): Instante de referencia (epoch); por defecto, el actual
+        
+        Returns:
+            list: IDs de los usuarios que acaban de expirar
+        """
+        if now is None:
+            now = time.time()
+        with self.db.transaction() as conn:
+            rows = conn.execute(EXPIRE_SUBSCRIPTIONS_SQL, (now,)).fetchall()
+        return [row[0] for row in rows]
+
+    # Funciones para expulsión de usuarios expirados
+    def add_pending_expulsions(self, targets):
+        """
+        Registra expulsiones pendientes.
+        
+        Args:
+            targets (list): [(user_id, channel_id), ...]
+        """
+        with self.db.transaction() as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO vip_expulsions (user_id, channel_id, status)
+                VALUES (?, ?, 'pending')
+            ''', targets)
+
+    def get_pending_expulsions(self):
+        with self.db.connection() as conn:
+            return conn.execute('''
+                SELECT user_id, channel_id
+                FROM vip_expulsions
+                WHERE status = 'pending'
+            ''').fetchall()
+
+    def record_expulsion_results(self, results):
+        """
+        Guarda el resultado de un lote de expulsiones en una sola transacción.
+        
+        Args:
+            results (list): [(status, error, user_id, channel_id), ...]
+        """
+        with self.db.transaction() as conn:
+            conn.executemany('''
+                UPDATE vip_expulsions
+                SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = ? AND channel_id = ?
+            ''', results)
+
+    def create_broadcast(self, draft_id, audience, window=86400):
+        """
+        Crea una difusión a partir de un borrador y registra sus destinatarios.
+        
+        Args:
+            draft_id (int): ID del borrador en message_drafts
+            audience (str): 'active', 'expiring' o 'expired' (ver BROADCAST_AUDIENCES)
+            window (int): Segundos hasta el vencimiento para la audiencia 'expiring'
+            
+        Returns:
+            tuple: (broadcast_id, número de destinatarios), o None si el borrador no existe
+        """
+        if audience not in BROADCAST_AUDIENCES:
+            raise ValueError(f"Audiencia desconocida: {audience}")
+        
+        with self.db.transaction() as conn:
+            cursor = conn.execute('''
+                INSERT INTO broadcasts (audience, message_text, file_id, file_type, disable_downloads)
+                SELECT ?, message_text, file_id, file_type, disable_downloads
+                FROM message_drafts
+                WHERE id = ?
+            ''', (audience, draft_id))
+            if not cursor.rowcount:
+                return None
+            broadcast_id = cursor.lastrowid
+            
+            cursor = conn.execute(f'''
+                INSERT INTO broadcast_recipients (broadcast_id, user_id)
+                SELECT :broadcast_id, user_id FROM vip_users
+                WHERE {BROADCAST_AUDIENCES[audience]}
+            ''', {'broadcast_id': broadcast_id, 'now': int(time.time()), 'window': window})
+        return broadcast_id, cursor.rowcount
+
+    def get_broadcast(self, broadcast_id):
+        with self.db.connection() as conn:
+            return conn.execute('''
+                SELECT id, audience, message_text, file_id, file_type, disable_downloads, status
+                FROM broadcasts
+                WHERE id = ?
+            ''', (broadcast_id,)).fetchone()
+
+    def get_running_broadcasts(self):
+        with self.db.connection() as conn:
+            return [row[0] for row in conn.execute("SELECT id FROM broadcasts WHERE status = 'running'")]
+
+    def get_pending_broadcast_recipients(self, broadcast_id, limit=500):
+        with self.db.connection() as conn:
+            return [row[0] for row in conn.execute(PENDING_BROADCAST_RECIPIENTS_SQL, (broadcast_id, limit))]
+
+    def record_broadcast_results(self, broadcast_id, results):
+        """
+        Guarda el resultado de un lote de envíos en una sola transacción.
+        
+        Args:
+            broadcast_id (int): ID de la difusión
+            results (list): [(status, error, user_id), ...]
+        """
+        with self.db.transaction() as conn:
+            conn.executemany('''
+                UPDATE broadcast_recipients
+                SET status = ?, error = ?
+                WHERE broadcast_id = ? AND user_id = ?
+            ''', [(status, error, broadcast_id, user_id) for status, error, user_id in results])
+            self._mark_blocked(conn, [user_id for status, error, user_id in results if status == 'blocked'])
+
+    def finish_broadcast(self, broadcast_id):
+        """
+        Marca la difusión como terminada.
+        
+        Returns:
+            dict: {estado: cantidad} de sus destinatarios
+        """
+        with self.db.transaction() as conn:
+            conn.execute('''
+                UPDATE broadcasts
+                SET status = 'done', finished_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE id = ?
+            ''', (broadcast_id,))
+            return dict(conn.execute('''
+                SELECT status, COUNT(*) FROM broadcast_recipients
+                WHERE broadcast_id = ?
+                GROUP BY status
+            ''', (broadcast_id,)).fetchall())
+
+    def enqueue_reminders(self, reminders):
+        """
+        Reserva el recordatorio de cada usuario para su periodo actual y lo encola en
+        outbox en la misma transacción: se envía una sola vez aunque el planificador lo
+        entregue de nuevo (p. ej. tras un reinicio), y una reserva nunca queda sin su
+        mensaje. Se omiten los usuarios que bloquearon al bot o que renovaron.
+        
+        Args:
+            reminders (list): [(user_id, subscription_end, message), ...] con message
+                (kind, chat_id, payload, idempotency_key) como en enqueue_outbox
+            
+        Returns:
+            list: IDs en la cola de los recordatorios reservados
+        """
+        now = int(time.time())
+        messages = []
+        with self.db.transaction() as conn:
+            for user_id, subscription_end, message in reminders:
+                row = conn.execute('''
+                    UPDATE vip_users
+                    SET reminded_at = ?
+                    WHERE user_id = ? AND subscription_end = ? AND status = 'active'
+                        AND reminded_at IS NULL AND blocked_at IS NULL
+                    RETURNING user_id
+                ''', (now, user_id, subscription_end)).fetchone()
+                if row:
+                    messages.append(message)
+            return self.enqueue_outbox(messages)
+
+    def _mark_blocked(self, conn, user_ids):
+        conn.executemany(
+            'UPDATE vip_users SET blocked_at = ? WHERE user_id = ?',
+            [(int(time.time()), user_id) for user_id in user_ids]
+        )
+
+    def enqueue_outbox(self, messages):
+        """
+        Añade mensajes a la cola de salida. Un mensaje cuya clave de idempotencia
+        ya está pendiente o enviada no se vuelve a encolar: se devuelve el ID del
+        registrado. Si fue descartado ('blocked', 'dead'), se reactiva.
+        
+        Args:
+            messages (list): [(kind, chat_id, payload, idempotency_key), ...]
+                con payload un dict serializable a JSON y la clave opcional
+            
+        Returns:
+            list: IDs en la cola de cada mensaje, en el mismo orden
+        """
+        ids = []
+        with self.db.transaction() as conn:
+            for kind, chat_id, payload, idempotency_key in messages:
+                row = conn.execute('''
+                    INSERT INTO outbox (kind, chat_id, payload, idempotency_key)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (idempotency_key) DO UPDATE
+                    SET status = 'pending', attempts = 0, last_error = NULL, payload = excluded.payload,
+                        next_attempt_at = excluded.next_attempt_at
+                    WHERE status IN ('blocked', 'dead')
+                    RETURNING id
+                ''', (kind, chat_id, json.dumps(payload), idempotency_key)).fetchone()
+                if row is None:
+                    row = conn.execute(
+                        'SELECT id FROM outbox WHERE idempotency_key = ?', (idempotency_key,)
+                    ).fetchone()
+                ids.append(row[0])
+        return ids
+
+    def claim_outbox(self, lease, limit=100, ids=None):
+        """
+        Reserva mensajes pendientes y vencidos de la cola durante `lease` segundos.
+        
+        Args:
+            lease (int): Segundos durante los que ningún otro envío los tomará
+            limit (int): Máximo de mensajes vencidos a reservar
+            ids (list, optional): Reservar solo estos mensajes (si siguen pendientes)
+            
+        Returns:
+            list: (id, kind, chat_id, payload, attempts) con payload ya decodificado
+        """
+        now = int(time.time())
+        with self.db.transaction() as conn:
+            if ids is None:
+                rows = conn.execute(CLAIM_DUE_OUTBOX_SQL, (now + lease, now, limit)).fetchall()
+            else:
+                rows = []
+                for message_id in ids:
+                    row = conn.execute('''
+                        UPDATE outbox SET next_attempt_at = ?
+                        WHERE id = ? AND status = 'pending' AND next_attempt_at <= ?
+                        RETURNING id, kind, chat_id, payload, attempts
+                    ''', (now + lease, message_id, now)).fetchone()
+                    if row:
+                        rows.append(row)
+        return [(message_id, kind, chat_id, json.loads(payload), attempts)
+                for message_id, kind, chat_id, payload, attempts in rows]
+
+    def record_outbox_results(self, results):
+        """
+        Guarda el resultado de los intentos de envío de la cola.
+        
+        Args:
+            results (list): [(id, status, error, next_attempt_at, counted), ...] con status
+                'sent', 'pending' (reintento en next_attempt_at), 'blocked' o 'dead', y
+                counted False si el intento no cuenta para el máximo (p. ej. RetryAfter)
+        """
+        now = int(time.time())
+        with self.db.transaction() as conn:
+            conn.executemany('''
+                UPDATE outbox
+                SET status = ?, attempts = attempts + ?, last_error = ?,
+                    next_attempt_at = COALESCE(?, next_attempt_at),
+                    sent_at = CASE WHEN ? = 'sent' THEN ? END
+                WHERE id = ?
+            ''', [(status, int(counted), error, next_attempt_at, status, now, message_id)
+                  for message_id, status, error, next_attempt_at, counted in results])
+            # Un recordatorio bloqueado en cualquier intento marca al usuario para no volver a escribirle
+            conn.executemany('''
+                UPDATE vip_users SET blocked_at = ?
+                WHERE blocked_at IS NULL AND user_id = (
+                    SELECT chat_id FROM outbox WHERE id = ? AND idempotency_key LIKE 'reminder:%'
+                )
+            ''', [(now, message_id) for message_id, status, error, next_attempt_at, counted in results
+                  if status == 'blocked'])
+
+    def get_outbox_statuses(self, ids):
+        """
+        Returns:
+            dict: {id: status} de los mensajes indicados
+        """
+        if not ids:
+            return {}
+        with self.db.connection() as conn:
+            return dict(conn.execute(
+                f"SELECT id, status FROM outbox WHERE id IN ({', '.join('?' * len(ids))})", list(ids)
+            ).fetchall())
+
+    def get_next_outbox_time(self):
+        """
+        Returns:
+            int: next_attempt_at (epoch) del próximo mensaje pendiente, o None si la cola está vacía
+        """
+        with self.db.connection() as conn:
+            return conn.execute(NEXT_OUTBOX_SQL).fetchone()[0]
+
+    def purge_outbox(self, before):
+        """
+        Elimina de la cola los mensajes enviados antes de `before` (epoch).
+        Los mensajes descartados ('blocked', 'dead') se conservan para revisión.
+        """
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?", (before,))
+
+    def add_free_channel_request(self, user_id, username, chat_id=None):
+        """
+        Registra una solicitud de ingreso al canal gratuito.
+        
+        Returns:
+            int: requested_at (epoch) de la solicitud, o None si ya existía
+        """
+        with self.db.transaction() as conn:
+            row = conn.execute('''
+                INSERT OR IGNORE INTO free_channel_requests (user_id, username, chat_id)
+                VALUES (?, ?, ?)
+                RETURNING requested_at
+            ''', (user_id, username, chat_id)).fetchone()
+        return row[0] if row else None
+
+    def add_free_channel_requests(self, requests):
+        """
+        Registra un lote de solicitudes en una sola transacción.
+        
+        Args:
+            requests (list): [(user_id, username, chat_id), ...]
+        
+        Returns:
+            int: Número de solicitudes nuevas insertadas
+        """
+        with self.db.transaction() as conn:
+            changes_before = conn.total_changes
+            conn.executemany('''
+                INSERT OR IGNORE INTO free_channel_requests (user_id, username, chat_id)
+                VALUES (?, ?, ?)
+            ''', requests)
+            return conn.total_changes - changes_before
 
     def get_pending_free_requests(self):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT user_id, username, requested_at 
-            FROM free_channel_requests 
-            WHERE processed = FALSE
-        ''')
-        requests = cursor.fetchall()
-        conn.close()
-        return requests
-
-    def mark_request_processed(self, user_id, requested_at):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE free_channel_requests 
-            SET processed = TRUE 
-            WHERE user_id = ? AND requested_at = ?
-        ''', (user_id, requested_at))
-        conn.commit()
-        conn.close()
+        with self.db.connection() as conn:
+            return conn.execute(PENDING_FREE_REQUESTS_SQL).fetchall()
+
+    def get_due_free_requests(self, cutoff, limit=100):
+        """
+        Obtiene las solicitudes pendientes cuyo delay ya venció, las más antiguas primero.
+        
+        Args:
+            cutoff (int): Epoch límite; vencen las solicitudes con requested_at <= cutoff
+            limit (int): Número máximo de solicitudes a devolver
+            
+        Returns:
+            list: (id, user_id, username, requested_at, chat_id) de cada solicitud
+        """
+        with self.db.connection() as conn:
+            return conn.execute(DUE_FREE_REQUESTS_SQL, (cutoff, limit)).fetchall()
+
+    def get_next_free_request_time(self, cutoff):
+        """
+        Obtiene el requested_at de la próxima solicitud pendiente que aún no ha vencido.
+        
+        Args:
+            cutoff (int): Epoch límite usado en get_due_free_requests
+            
+        Returns:
+            int: requested_at (epoch) de la solicitud, o None si no hay ninguna
+        """
+        with self.db.connection() as conn:
+            return conn.execute(NEXT_FREE_REQUEST_SQL, (cutoff,)).fetchone()[0]
+
+    def mark_requests_processed(self, request_ids):
+        """
+        Marca un lote de solicitudes como procesadas en una sola transacción.
+        
+        Args:
+            request_ids (list): id de cada solicitud (ver get_pending_free_requests)
+        """
+        with self.db.transaction() as conn:
+            conn.executemany('''
+                UPDATE free_channel_requests 
+                SET processed = TRUE 
+                WHERE id = ?
+            ''', [(request_id,) for request_id in request_ids])
 
     # Funciones para manejo de canales
     def add_channel(self, channel_id, channel_name, channel_type):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO channels (channel_id, channel_name, channel_type)
-            VALUES (?, ?, ?)
-        ''', (channel_id, channel_name, channel_type))
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO channels (channel_id, channel_name, channel_type)
+                VALUES (?, ?, ?)
+            ''', (channel_id, channel_name, channel_type))
+        self.channels.put(channel_id, channel_name, channel_type)
 
     def get_channel(self, channel_type):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT channel_id, channel_name 
-            FROM channels 
-            WHERE channel_type = ? AND is_active = TRUE
-        ''', (channel_type,))
-        channel = cursor.fetchone()
-        conn.close()
-        return channel
+        return self.channels.first_active(channel_type)
+
+    def get_channels(self, channel_type):
+        return self.channels.get_active(channel_type)
 
     def get_all_channels(self):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT channel_id, channel_name, channel_type, is_active
-            FROM channels
-            ORDER BY channel_type
-        ''')
-        channels = cursor.fetchall()
-        conn.close()
-        return channels
+        return self.channels.all()
 
     def delete_channel(self, channel_id):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM channels WHERE channel_id = ?', (channel_id,))
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM channels WHERE channel_id = ?', (channel_id,))
+        self.channels.remove(channel_id)
 
     def toggle_channel_status(self, channel_id, is_active):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE channels 
-            SET is_active = ? 
-            WHERE channel_id = ?
-        ''', (is_active, channel_id))
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as conn:
+            conn.execute('''
+                UPDATE channels 
+                SET is_active = ? 
+                WHERE channel_id = ?
+            ''', (is_active, channel_id))
+        self.channels.set_active(channel_id, is_active)
 
     # Funciones para manejo de tarifas VIP
     def add_vip_rate(self, name, days, cost):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO vip_rates (name, days, cost)
-            VALUES (?, ?, ?)
-        ''', (name, days, cost))
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as conn:
+            conn.execute('''
+                INSERT INTO vip_rates (name, days, cost)
+                VALUES (?, ?, ?)
+            ''', (name, days, cost))
+        self.rates_version += 1
 
     def get_vip_rates(self):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, name, days, cost, is_active
-            FROM vip_rates
-            ORDER BY days
-        ''')
-        rates = cursor.fetchall()
-        conn.close()
-        return rates
+        with self.db.connection() as conn:
+            return conn.execute('''
+                SELECT id, name, days, cost, is_active
+                FROM vip_rates
+                ORDER BY days
+            ''').fetchall()
 
     def get_vip_rate(self, rate_id):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, name, days, cost, is_active FROM vip_rates WHERE id = ?', (rate_id,))
-        rate = cursor.fetchone()
-        conn.close()
-        return rate
+        with self.db.connection() as conn:
+            return conn.execute('SELECT id, name, days, cost, is_active FROM vip_rates WHERE id = ?', (rate_id,)).fetchone()
 
     def update_vip_rate(self, rate_id, name=None, days=None, cost=None):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        
-        # Get current rate data
-        current_rate = self.get_vip_rate(rate_id)
-        if not current_rate:
-            return False
-        
-        current_name, current_days, current_cost = current_rate[1], current_rate[2], current_rate[3]
-        
-        # Use provided values or keep current ones
-        update_name = name if name is not None else current_name
-        update_days = days if days is not None else current_days
-        update_cost = cost if cost is not None else current_cost
-        
-        cursor.execute('''
-            UPDATE vip_rates 
-            SET name = ?, days = ?, cost = ?
-            WHERE id = ?
-        ''', (update_name, update_days, update_cost, rate_id))
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as conn:
+            # Get current rate data
+            current_rate = self.get_vip_rate(rate_id)
+            if not current_rate:
+                return False
+            
+            current_name, current_days, current_cost = current_rate[1], current_rate[2], current_rate[3]
+            
+            # Use provided values or keep current ones
+            update_name = name if name is not None else current_name
+            update_days = days if days is not None else current_days
+            update_cost = cost if cost is not None else current_cost
+            
+            conn.execute('''
+                UPDATE vip_rates 
+                SET name = ?, days = ?, cost = ?
+                WHERE id = ?
+            ''', (update_name, update_days, update_cost, rate_id))
+        self.rates_version += 1
         return True
 
     def delete_vip_rate(self, rate_id):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM vip_rates WHERE id = ?', (rate_id,))
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM vip_rates WHERE id = ?', (rate_id,))
+        self.rates_version += 1
 
     def toggle_vip_rate_status(self, rate_id, is_active):
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE vip_rates 
-            SET is_active = ? 
-            WHERE id = ?
-        ''', (is_active, rate_id))
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as conn:
+            conn.execute('''
+                UPDATE vip_rates 
+                SET is_active = ? 
+                WHERE id = ?
+            ''', (is_active, rate_id))
+        self.rates_version += 1
 
     # Funciones para envío de mensajes a canales
-    async def send_message_to_channel(self, channel_type, message_text, file_path=None, file_id=None, file_type=None, disable_downloads=False, context=None):
-        """
-        Envía un mensaje al canal especificado.
-        
-        Args:
-            channel_type (str): 'vip' o 'free'
-            message_text (str): Texto del mensaje
-            file_path (str, optional): Ruta al archivo adjunto (legacy)
-            file_id (str, optional): ID del archivo en Telegram
-            file_type (str, optional): Tipo de archivo ('photo', 'video', 'document')
-            disable_downloads (bool): Si deshabilitar descargas
-            context: Contexto de Telegram para enviar el mensaje
-        
-        Returns:
-            bool: True si se envió correctamente, False en caso de error
-        """
-        if not context or not context.bot:
-            return False
-        
-        channel = self.get_channel(channel_type)
-        if not channel:
-            return False
-        
-        channel_id, channel_name = channel
-        
-        try:
-            if file_id and file_type:
-                # Enviar mensaje con archivo adjunto usando file_id
-                kwargs = {
-                    "chat_id": channel_id,
-                    "caption": message_text,
-                    "parse_mode": 'HTML',
-                    "protect_content": disable_downloads
-                }
-                
-                if file_type == 'photo':
-                    await context.bot.send_photo(photo=file_id, **kwargs)
-                elif file_type == 'video':
-                    await context.bot.send_video(video=file_id, **kwargs)
-                elif file_type == 'document':
-                    await context.bot.send_document(document=file_id, **kwargs)
-                else:
-                    # Fallback para tipos desconocidos
-                    await context.bot.send_document(document=file_id, **kwargs)
-            else:
-                # Enviar solo texto
-                await context.bot.send_message(
-                    chat_id=channel_id,
-                    text=message_text,
-                    parse_mode='HTML',
-                    protect_content=disable_downloads
-                )
-            
-            return True
-            
-        except Exception as e:
-            print(f"Error enviando mensaje al canal {channel_type}: {e}")
-            return False
-
     def save_message_draft(self, channel_type, message_text, file_path=None, file_id=None, file_type=None, disable_downloads=False):
         """
         Guarda un borrador de mensaje en la base de datos.
@@ -416,32 +787,13 @@ class AdminBot:
         Returns:
             int: ID del borrador guardado
         """
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS message_drafts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_type TEXT NOT NULL,
-                message_text TEXT NOT NULL,
-                file_path TEXT,
-                file_id TEXT,
-                file_type TEXT,
-                disable_downloads BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        with self.db.transaction() as conn:
+            cursor = conn.execute('''
+                INSERT INTO message_drafts (channel_type, message_text, file_path, file_id, file_type, disable_downloads)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (channel_type, message_text, file_path, file_id, file_type, disable_downloads))
         
-        cursor.execute('''
-            INSERT INTO message_drafts (channel_type, message_text, file_path, file_id, file_type, disable_downloads)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (channel_type, message_text, file_path, file_id, file_type, disable_downloads))
-        
-        draft_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        return draft_id
+        return cursor.lastrowid
 
     def get_message_draft(self, draft_id):
         """
@@ -453,19 +805,35 @@ class AdminBot:
         Returns:
             tuple: Datos del borrador o None si no existe
         """
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, channel_type, message_text, file_path, file_id, file_type, disable_downloads, created_at
-            FROM message_drafts
-            WHERE id = ?
-        ''', (draft_id,))
-        
-        draft = cursor.fetchone()
-        conn.close()
+        with self.db.connection() as conn:
+            return conn.execute('''
+                SELECT id, channel_type, message_text, file_path, file_id, file_type, disable_downloads, created_at, send_at
+                FROM message_drafts
+                WHERE id = ?
+            ''', (draft_id,)).fetchone()
+
+    def schedule_message_draft(self, draft_id, send_at):
+        """
+        Programa (o desprograma, con send_at None) la publicación de un borrador.
         
-        return draft
+        Args:
+            draft_id (int): ID del borrador
+            send_at (int): Fecha de publicación (epoch) o None
+            
+        Returns:
+            bool: True si el borrador existe
+        """
+        with self.db.transaction() as conn:
+            cursor = conn.execute('UPDATE message_drafts SET send_at = ? WHERE id = ?', (send_at, draft_id))
+        return cursor.rowcount > 0
+
+    def get_scheduled_drafts(self):
+        """
+        Returns:
+            list: (draft_id, channel_type, send_at) de los borradores programados, por fecha
+        """
+        with self.db.connection() as conn:
+            return conn.execute(SCHEDULED_DRAFTS_SQL).fetchall()
 
     def delete_message_draft(self, draft_id):
         """
@@ -474,13 +842,109 @@ class AdminBot:
         Args:
             draft_id (int): ID del borrador
         """
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM message_drafts WHERE id = ?', (draft_id,))
+            conn.execute('DELETE FROM draft_channels WHERE draft_id = ?', (draft_id,))
+
+    def set_draft_channels(self, draft_id, channel_ids):
+        """
+        Reemplaza los canales de destino de un borrador.
+        
+        Args:
+            draft_id (int): ID del borrador
+            channel_ids (list): IDs de los canales; vacía para usar el canal de su tipo
+        """
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM draft_channels WHERE draft_id = ?', (draft_id,))
+            conn.executemany(
+                'INSERT INTO draft_channels (draft_id, channel_id) VALUES (?, ?)',
+                [(draft_id, channel_id) for channel_id in channel_ids]
+            )
+
+    def get_draft_channels(self, draft_id, channel_type):
+        """
+        Obtiene los canales activos donde se publicará un borrador.
         
-        cursor.execute('DELETE FROM message_drafts WHERE id = ?', (draft_id,))
-        conn.commit()
-        conn.close()
+        Args:
+            draft_id (int): ID del borrador
+            channel_type (str): Tipo del borrador, para el canal por defecto
+            
+        Returns:
+            list: [(channel_id, channel_name), ...] elegidos, o el canal activo de su tipo
+                si no se eligió ninguno
+        """
+        with self.db.connection() as conn:
+            channel_ids = [row[0] for row in conn.execute(
+                'SELECT channel_id FROM draft_channels WHERE draft_id = ? ORDER BY channel_id', (draft_id,)
+            )]
+        if not channel_ids:
+            default_channel = self.get_channel(channel_type)
+            return [default_channel] if default_channel else []
+        
+        channels = []
+        for channel_id in channel_ids:
+            channel = self.channels.get(channel_id)
+            # Canales eliminados o desactivados después de elegirlos
+            if channel and channel[3]:
+                channels.append(channel[:2])
+        return channels
+
+class AsyncAdminBot:
+    """
+    Fachada asíncrona sobre AdminBot.
+    Cada método síncrono se ejecuta en un executor dedicado a la base de datos,
+    de modo que el event loop de python-telegram-bot nunca espera por I/O de disco.
+    """
+
+    MEMORY_METHODS = frozenset({
+        'get_free_channel_delay',
+        'get_channel',
+        'get_channels',
+        'get_all_channels',
+    })
+
+    def __init__(self, admin_bot, max_workers=None):
+        """
+        Args:
+            admin_bot (AdminBot): Instancia síncrona a envolver
+            max_workers (int, optional): Hilos del executor (por defecto, el tamaño del pool)
+        """
+        self.admin_bot = admin_bot
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or admin_bot.db.size,
+            thread_name_prefix='adminbot-db'
+        )
+
+    async def run(self, func, *args, **kwargs):
+        """Ejecuta una función síncrona en el executor de base de datos"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self.admin_bot, name)
+        if not callable(attr) or asyncio.iscoroutinefunction(attr):
+            return attr
+
+        if name in self.MEMORY_METHODS:
+            # Lecturas servidas desde cachés en memoria: no necesitan el executor
+            @functools.wraps(attr)
+            async def call_inline(*args, **kwargs):
+                return attr(*args, **kwargs)
+
+            return call_inline
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        return call
+
+    def close(self):
+        """Detiene el executor y cierra las conexiones del pool"""
+        self.executor.shutdown(wait=True)
+        self.admin_bot.db.close()
 
 if __name__ == "__main__":
     bot = AdminBot()
+    bot.verify_query_plans()
     print("Database initialized successfully!")
\ No newline at end of file
@@ -0,0 +1,118 @@
+import asyncio
+from telegram.error import Forbidden, TelegramError
+from bot import send_content
+from throttling import call_with_retry
+
+class BroadcastWorker:
+    """
+    Difunde un borrador de mensaje por mensaje directo a una audiencia de
+    suscriptores VIP. Los envíos se ejecutan con concurrencia limitada bajo un
+    token bucket global (~30 mensajes/s), cada chat espera por separado ante
+    RetryAfter, y el estado de cada destinatario se guarda por lotes en
+    broadcast_recipients para poder reanudar la difusión tras un reinicio.
+    """
+
+    BATCH_SIZE = 500
+    AUDIENCES = ('active', 'expiring', 'expired')
+
+    def __init__(self, admin_bot, limiter, concurrency=16, max_retries=3):
+        """
+        Args:
+            admin_bot (AsyncAdminBot): Acceso asíncrono a la base de datos
+            limiter (TokenBucket): Limitador global de tasa compartido con el resto de envíos
+            concurrency (int): Envíos simultáneos
+            max_retries (int): Reintentos por mensaje ante RetryAfter o errores de red
+        """
+        self.admin_bot = admin_bot
+        self.concurrency = concurrency
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self._tasks = set()
+
+    def start(self, application):
+        """Reanuda en segundo plano las difusiones que quedaron a medias de antes del reinicio"""
+        self.spawn(self.resume(application.bot))
+
+    def spawn(self, coro):
+        """
+        Ejecuta una corrutina en segundo plano como tarea propia del worker.
+        No se usa Application.create_task: Application.stop() esperaría a que
+        terminara toda la difusión; stop() la cancela y el progreso, guardado por lotes,
+        se reanuda al volver a arrancar.
+        """
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def stop(self):
+        """Cancela las tareas en curso y espera a que terminen"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def create(self, draft_id, audience):
+        """
+        Registra una difusión con sus destinatarios.
+
+        Args:
+            draft_id (int): ID del borrador a difundir
+            audience (str): 'active', 'expiring' o 'expired'
+
+        Returns:
+            tuple: (broadcast_id, número de destinatarios), o None si el borrador no existe
+        """
+        return await self.admin_bot.create_broadcast(draft_id, audience)
+
+    async def run(self, bot, broadcast_id):
+        """
+        Envía la difusión a sus destinatarios pendientes.
+
+        Args:
+            bot (Bot): Bot de Telegram
+            broadcast_id (int): ID de la difusión
+
+        Returns:
+            dict: {estado: cantidad} con el resultado de todos sus destinatarios
+        """
+        broadcast = await self.admin_bot.get_broadcast(broadcast_id)
+        if not broadcast:
+            return {}
+        broadcast_id, audience, message_text, file_id, file_type, disable_downloads, status = broadcast
+        content = (message_text, file_id, file_type, bool(disable_downloads))
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(user_id):
+            async with semaphore:
+                return await self._send(bot, user_id, content)
+
+        while True:
+            user_ids = await self.admin_bot.get_pending_broadcast_recipients(broadcast_id, self.BATCH_SIZE)
+            if not user_ids:
+                break
+            results = await asyncio.gather(*(send(user_id) for user_id in user_ids))
+            await self.admin_bot.record_broadcast_results(broadcast_id, results)
+
+        summary = await self.admin_bot.finish_broadcast(broadcast_id)
+        print(f"Difusión {broadcast_id} ({audience}) terminada: {summary}")
+        return summary
+
+    async def resume(self, bot):
+        """Reanuda las difusiones que quedaron a medias (p. ej. tras un reinicio)"""
+        for broadcast_id in await self.admin_bot.get_running_broadcasts():
+            await self.run(bot, broadcast_id)
+
+    async def _send(self, bot, user_id, content):
+        message_text, file_id, file_type, disable_downloads = content
+        try:
+            await call_with_retry(
+                send_content, bot, user_id, message_text, file_id, file_type, disable_downloads,
+                limiter=self.limiter, max_retries=self.max_retries, global_backoff=False
+            )
+            return ('sent', None, user_id)
+        except Forbidden as e:
+            # El usuario bloqueó al bot o eliminó su cuenta
+            return ('blocked', str(e), user_id)
+        except TelegramError as e:
+            return ('failed', str(e), user_id)
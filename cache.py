@@ -0,0 +1,190 @@
+import threading
+
+class ConfigCache:
+    """
+    Caché en memoria de la tabla config.
+    La tabla se carga una vez y cada escritura se persiste en SQLite antes de
+    actualizar la memoria (write-through), de modo que leer configuración no
+    toca la base de datos.
+    """
+
+    def __init__(self, db):
+        """
+        Args:
+            db (ConnectionPool): Pool de conexiones a la base de datos
+        """
+        self.db = db
+        self._values = None
+        self._lock = threading.RLock()
+        self._listeners = []
+
+    def load(self):
+        """Carga (o recarga) toda la tabla config en memoria"""
+        with self._lock:
+            self._values = None
+            self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        if self._values is None:
+            with self.db.connection() as conn:
+                rows = conn.execute('SELECT key, value FROM config').fetchall()
+            self._values = dict(rows)
+        return self._values
+
+    def get(self, key, default=None, value_type=str):
+        """
+        Obtiene un valor de configuración desde memoria.
+
+        Args:
+            key (str): Clave de configuración
+            default: Valor devuelto si la clave no existe o no es convertible
+            value_type (type): Tipo al que convertir el valor (str, int, float)
+
+        Returns:
+            El valor convertido o el valor por defecto
+        """
+        with self._lock:
+            value = self._ensure_loaded().get(key)
+        if value is None:
+            return default
+        try:
+            return value_type(value)
+        except (TypeError, ValueError):
+            return default
+
+    def get_int(self, key, default=None):
+        return self.get(key, default, int)
+
+    def set(self, key, value):
+        """
+        Guarda un valor en la base de datos y en memoria.
+
+        Args:
+            key (str): Clave de configuración
+            value: Valor a guardar (se almacena como texto)
+        """
+        value = str(value)
+        with self._lock:
+            with self.db.transaction() as conn:
+                conn.execute('INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)', (key, value))
+            if self._values is not None:
+                self._values[key] = value
+        self._notify(key, value)
+
+    def invalidate(self, key=None):
+        """
+        Descarta valores en memoria para releerlos de la base de datos.
+
+        Args:
+            key (str, optional): Clave a descartar; si se omite se descarta toda la caché
+        """
+        with self._lock:
+            if key is None:
+                self._values = None
+            elif self._values is not None:
+                self._values.pop(key, None)
+                # Releer solo la clave descartada
+                with self.db.connection() as conn:
+                    row = conn.execute('SELECT value FROM config WHERE key = ?', (key,)).fetchone()
+                if row:
+                    self._values[key] = row[0]
+        self._notify(key, None)
+
+    def subscribe(self, callback):
+        """
+        Registra un callback(key, value) que se invoca tras cada set() o invalidate().
+        En invalidate() value es None y key es None si se descartó toda la caché.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, key, value):
+        for callback in self._listeners:
+            callback(key, value)
+
+class ChannelRegistry:
+    """
+    Registro en memoria de la tabla channels.
+    Se carga una vez al iniciar y AdminBot lo mantiene coherente en cada
+    alta, baja o cambio de estado, de modo que resolver un canal por tipo
+    o por ID no consulta la base de datos.
+    """
+
+    def __init__(self, db):
+        """
+        Args:
+            db (ConnectionPool): Pool de conexiones a la base de datos
+        """
+        self.db = db
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._active_by_type = {}
+        # Se incrementa en cada cambio; permite a otras cachés detectar datos obsoletos
+        self.version = 0
+
+    def load(self):
+        """Carga todos los canales desde la base de datos"""
+        with self.db.connection() as conn:
+            rows = conn.execute('''
+                SELECT channel_id, channel_name, channel_type, is_active
+                FROM channels
+            ''').fetchall()
+        with self._lock:
+            self._by_id = {row[0]: (row[0], row[1], row[2], bool(row[3])) for row in rows}
+            self._rebuild_index()
+
+    def _rebuild_index(self):
+        active_by_type = {}
+        for channel_id, channel_name, channel_type, is_active in sorted(self._by_id.values()):
+            if is_active:
+                active_by_type.setdefault(channel_type, []).append((channel_id, channel_name))
+        self._active_by_type = active_by_type
+        self.version += 1
+
+    def put(self, channel_id, channel_name, channel_type, is_active=True):
+        """Registra o reemplaza un canal"""
+        with self._lock:
+            self._by_id[channel_id] = (channel_id, channel_name, channel_type, bool(is_active))
+            self._rebuild_index()
+
+    def remove(self, channel_id):
+        """Elimina un canal del registro"""
+        with self._lock:
+            if self._by_id.pop(channel_id, None) is not None:
+                self._rebuild_index()
+
+    def set_active(self, channel_id, is_active):
+        """Actualiza el estado activo de un canal"""
+        with self._lock:
+            channel = self._by_id.get(channel_id)
+            if channel:
+                self._by_id[channel_id] = channel[:3] + (bool(is_active),)
+                self._rebuild_index()
+
+    def get(self, channel_id):
+        """
+        Returns:
+            tuple: (channel_id, channel_name, channel_type, is_active) o None
+        """
+        return self._by_id.get(channel_id)
+
+    def get_active(self, channel_type):
+        """
+        Returns:
+            list: [(channel_id, channel_name), ...] activos del tipo indicado
+        """
+        return list(self._active_by_type.get(channel_type, ()))
+
+    def first_active(self, channel_type):
+        """
+        Returns:
+            tuple: (channel_id, channel_name) del primer canal activo del tipo, o None
+        """
+        channels = self._active_by_type.get(channel_type)
+        return channels[0] if channels else None
+
+    def all(self):
+        """
+        Returns:
+            list: [(channel_id, channel_name, channel_type, is_active), ...] ordenados por tipo
+        """
+        return sorted(self._by_id.values(), key=lambda channel: (channel[2], channel[0]))
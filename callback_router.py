@@ -0,0 +1,84 @@
+from telegram.ext import CallbackQueryHandler
+
+# Formato de callback_data: "accion:arg1:arg2". Telegram limita callback_data a 64 bytes.
+SEPARATOR = ':'
+MAX_CALLBACK_BYTES = 64
+
+def encode_callback(action, *args):
+    """
+    Construye el callback_data de un botón.
+
+    Args:
+        action (str): Acción registrada en el CallbackRouter
+        *args: Argumentos de la acción (se convierten a str)
+
+    Returns:
+        str: callback_data con el formato "accion:arg1:arg2"
+    """
+    data = SEPARATOR.join([action, *(str(arg) for arg in args)])
+    if len(data.encode('utf-8')) > MAX_CALLBACK_BYTES:
+        raise ValueError(f"callback_data excede {MAX_CALLBACK_BYTES} bytes: {data}")
+    return data
+
+def decode_callback(data):
+    """
+    Separa un callback_data en acción y argumentos.
+
+    Args:
+        data (str): callback_data recibido
+
+    Returns:
+        tuple: (accion, [arg1, arg2, ...])
+    """
+    action, *args = data.split(SEPARATOR)
+    return action, args
+
+class CallbackRouter:
+    """
+    Despacho de botones inline con una única búsqueda en diccionario.
+    Reemplaza la lista de CallbackQueryHandler con patrones regex, que
+    python-telegram-bot evalúa uno a uno en cada pulsación. Los argumentos
+    del callback_data se entregan al handler en context.args.
+    """
+
+    def __init__(self, routes=None):
+        """
+        Args:
+            routes (dict, optional): {accion: corrutina (update, context)}
+        """
+        self._routes = {}
+        for action, callback in (routes or {}).items():
+            self.register(action, callback)
+
+    def register(self, action, callback):
+        if SEPARATOR in action:
+            raise ValueError(f"La acción no puede contener '{SEPARATOR}': {action}")
+        self._routes[action] = callback
+
+    def resolve(self, data):
+        """
+        Obtiene el handler y los argumentos de un callback_data.
+
+        Returns:
+            tuple: (handler o None, [args])
+        """
+        action, args = decode_callback(data)
+        return self._routes.get(action), args
+
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        if not query or not query.data:
+            return
+
+        callback, args = self.resolve(query.data)
+        if callback is None:
+            # Botón sin handler: responder para que Telegram no deje el botón cargando
+            await query.answer()
+            return
+
+        context.args = args
+        return await callback(update, context)
+
+    def handler(self):
+        """CallbackQueryHandler único que enruta todas las pulsaciones"""
+        return CallbackQueryHandler(self.dispatch)
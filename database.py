@@ -0,0 +1,181 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+TEMP_STORE_MODES = ('DEFAULT', 'FILE', 'MEMORY')
+
+class StorageProfile:
+    """
+    Conjunto de PRAGMAs aplicados a cada conexión SQLite.
+    Por defecto usa WAL para que las escrituras (expiración de suscripciones,
+    solicitudes del canal gratuito) no bloqueen a los lectores.
+    """
+
+    def __init__(self, journal_mode='WAL', synchronous='NORMAL', cache_size=-16000,
+                 mmap_size=134217728, busy_timeout=5000, temp_store='MEMORY'):
+        """
+        Args:
+            journal_mode (str): Modo de journal (WAL, DELETE, ...)
+            synchronous (str): Nivel de sincronización (OFF, NORMAL, FULL, EXTRA)
+            cache_size (int): Páginas de caché, o KiB si es negativo
+            mmap_size (int): Bytes de la base de datos mapeados en memoria
+            busy_timeout (int): Milisegundos de espera ante un bloqueo
+            temp_store (str): Almacenamiento temporal (DEFAULT, FILE, MEMORY)
+        """
+        self.journal_mode = self._choice('journal_mode', journal_mode, JOURNAL_MODES)
+        self.synchronous = self._choice('synchronous', synchronous, SYNCHRONOUS_MODES)
+        self.cache_size = int(cache_size)
+        self.mmap_size = int(mmap_size)
+        self.busy_timeout = int(busy_timeout)
+        self.temp_store = self._choice('temp_store', temp_store, TEMP_STORE_MODES)
+
+    @staticmethod
+    def _choice(name, value, allowed):
+        value = str(value).upper()
+        if value not in allowed:
+            raise ValueError(f"Valor inválido para {name}: {value}")
+        return value
+
+    @classmethod
+    def from_env(cls):
+        """Construye el perfil a partir de las variables DB_* del entorno"""
+        return cls(
+            journal_mode=os.getenv('DB_JOURNAL_MODE', 'WAL'),
+            synchronous=os.getenv('DB_SYNCHRONOUS', 'NORMAL'),
+            cache_size=os.getenv('DB_CACHE_SIZE', '-16000'),
+            mmap_size=os.getenv('DB_MMAP_SIZE', '134217728'),
+            busy_timeout=os.getenv('DB_BUSY_TIMEOUT', '5000'),
+            temp_store=os.getenv('DB_TEMP_STORE', 'MEMORY')
+        )
+
+    def apply(self, conn):
+        """Aplica los PRAGMAs del perfil a una conexión"""
+        conn.execute(f'PRAGMA busy_timeout = {self.busy_timeout}')
+        conn.execute(f'PRAGMA journal_mode = {self.journal_mode}')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA cache_size = {self.cache_size}')
+        conn.execute(f'PRAGMA mmap_size = {self.mmap_size}')
+        conn.execute(f'PRAGMA temp_store = {self.temp_store}')
+
+class ConnectionPool:
+    """
+    Pool de conexiones SQLite de larga duración.
+    Las conexiones se abren una sola vez y se reutilizan entre consultas,
+    evitando pagar la apertura y el parseo del esquema en cada callback.
+    """
+
+    def __init__(self, database_path, size=4, timeout=30.0, profile=None):
+        """
+        Args:
+            database_path (str): Ruta a la base de datos SQLite
+            size (int): Número máximo de conexiones abiertas
+            timeout (float): Segundos de espera por una conexión libre
+            profile (StorageProfile): PRAGMAs aplicados a cada conexión nueva
+        """
+        self.database_path = database_path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.profile = profile or StorageProfile()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        # isolation_level=None: las transacciones se abren explícitamente en transaction()
+        conn = sqlite3.connect(
+            self.database_path,
+            timeout=self.profile.busy_timeout / 1000,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        try:
+            self.profile.apply(conn)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No hay conexiones SQLite libres tras {self.timeout} segundos")
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Presta una conexión del pool durante el bloque.
+        Las llamadas anidadas en el mismo hilo reutilizan la misma conexión.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Ejecuta el bloque dentro de una transacción de escritura.
+        Hace COMMIT al salir y ROLLBACK si se produce una excepción.
+        Una transacción anidada se une a la transacción exterior.
+        """
+        with self.connection() as conn:
+            if conn.in_transaction:
+                yield conn
+                return
+
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    def close(self):
+        """Cierra todas las conexiones inactivas del pool"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
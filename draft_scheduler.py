@@ -0,0 +1,89 @@
+import time
+
+class DraftScheduler:
+    """
+    Publicación programada de borradores de mensajes.
+    Cada borrador con send_at tiene un job run_once en la cola de trabajos;
+    al iniciar se cargan una sola vez los programados desde message_drafts,
+    de modo que no se consulta periódicamente la tabla y las publicaciones
+    vencidas durante una caída salen al arrancar.
+    """
+
+    JOB_PREFIX = 'scheduled_draft'
+
+    def __init__(self, admin_bot, on_due=None):
+        """
+        Args:
+            admin_bot (AsyncAdminBot): Acceso asíncrono a la base de datos
+            on_due: Corrutina (context, draft_id) que publica el borrador vencido
+        """
+        self.admin_bot = admin_bot
+        self.on_due = on_due
+        self.job_queue = None
+
+    async def start(self, job_queue):
+        """
+        Arma un job por cada borrador programado.
+
+        Args:
+            job_queue (JobQueue): Cola de trabajos de la aplicación
+        """
+        self.job_queue = job_queue
+        for draft_id, channel_type, send_at in await self.admin_bot.get_scheduled_drafts():
+            self._arm(draft_id, send_at)
+
+    async def schedule(self, draft_id, send_at):
+        """
+        Programa la publicación de un borrador.
+
+        Args:
+            draft_id (int): ID del borrador
+            send_at (int): Fecha de publicación (epoch)
+
+        Returns:
+            bool: False si no hay cola de trabajos o el borrador no existe
+        """
+        if not self.job_queue:
+            return False
+        if not await self.admin_bot.schedule_message_draft(draft_id, send_at):
+            return False
+        self._arm(draft_id, send_at)
+        return True
+
+    async def cancel(self, draft_id):
+        """
+        Cancela la publicación programada de un borrador: retira su job y lo elimina.
+
+        Args:
+            draft_id (int): ID del borrador
+
+        Returns:
+            bool: False si el borrador no existe o ya no estaba programado
+        """
+        draft = await self.admin_bot.get_message_draft(draft_id)
+        if not draft or draft[-1] is None:
+            return False
+        self._disarm(draft_id)
+        await self.admin_bot.delete_message_draft(draft_id)
+        return True
+
+    def _job_name(self, draft_id):
+        return f"{self.JOB_PREFIX}:{draft_id}"
+
+    def _disarm(self, draft_id):
+        if self.job_queue:
+            for job in self.job_queue.get_jobs_by_name(self._job_name(draft_id)):
+                job.schedule_removal()
+
+    def _arm(self, draft_id, send_at):
+        self._disarm(draft_id)
+        self.job_queue.run_once(
+            self._run_due,
+            when=max(0.0, send_at - time.time()),
+            data=draft_id,
+            name=self._job_name(draft_id)
+        )
+
+    async def _run_due(self, context):
+        if self.on_due:
+            await self.on_due(context, context.job.data)
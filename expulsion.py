@@ -0,0 +1,113 @@
+import asyncio
+from telegram.error import BadRequest, TelegramError
+from throttling import call_with_retry
+
+class ExpulsionWorker:
+    """
+    Expulsa del canal VIP a los usuarios cuya suscripción expiró.
+    Procesa las expulsiones en lotes con concurrencia limitada y un limitador
+    global de tasa, reintenta ante RetryAfter y registra el resultado de cada
+    usuario en vip_expulsions para poder reanudar tras un reinicio.
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self, admin_bot, limiter, concurrency=8, max_retries=3):
+        """
+        Args:
+            admin_bot (AsyncAdminBot): Acceso asíncrono a la base de datos
+            limiter (TokenBucket): Limitador global de tasa compartido con el resto de envíos
+            concurrency (int): Llamadas simultáneas a la API de Telegram
+            max_retries (int): Reintentos por llamada ante RetryAfter o errores de red
+        """
+        self.admin_bot = admin_bot
+        self.concurrency = concurrency
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self._tasks = set()
+
+    def start(self, application):
+        """Reanuda en segundo plano las expulsiones pendientes de antes del reinicio"""
+        self.spawn(self.resume(application.bot))
+
+    def spawn(self, coro):
+        """
+        Ejecuta una corrutina en segundo plano como tarea propia del worker.
+        No se usa Application.create_task: Application.stop() esperaría a que
+        terminara toda la expulsión; stop() la cancela y el progreso, guardado por lotes,
+        se reanuda al volver a arrancar.
+        """
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def stop(self):
+        """Cancela las tareas en curso y espera a que terminen"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def expel(self, bot, user_ids):
+        """
+        Expulsa a los usuarios indicados de todos los canales VIP activos.
+
+        Args:
+            bot (Bot): Bot de Telegram
+            user_ids (list): IDs de los usuarios expirados
+
+        Returns:
+            dict: {estado: cantidad} con el resultado de la ejecución
+        """
+        channels = await self.admin_bot.get_channels('vip')
+        if not user_ids or not channels:
+            return {}
+
+        targets = [(user_id, channel_id) for user_id in user_ids for channel_id, channel_name in channels]
+        await self.admin_bot.add_pending_expulsions(targets)
+        return await self._process(bot, targets)
+
+    async def resume(self, bot):
+        """Reanuda las expulsiones que quedaron pendientes (p. ej. tras un reinicio)"""
+        targets = await self.admin_bot.get_pending_expulsions()
+        if not targets:
+            return {}
+        return await self._process(bot, targets)
+
+    async def _process(self, bot, targets):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        summary = {}
+
+        async def remove(user_id, channel_id):
+            async with semaphore:
+                return await self._remove(bot, user_id, channel_id)
+
+        for start in range(0, len(targets), self.BATCH_SIZE):
+            batch = targets[start:start + self.BATCH_SIZE]
+            results = await asyncio.gather(*(remove(user_id, channel_id) for user_id, channel_id in batch))
+            await self.admin_bot.record_expulsion_results(results)
+            for status, error, user_id, channel_id in results:
+                summary[status] = summary.get(status, 0) + 1
+
+        print(f"Expulsión de usuarios VIP expirados: {summary}")
+        return summary
+
+    async def _remove(self, bot, user_id, channel_id):
+        try:
+            await call_with_retry(
+                bot.ban_chat_member, chat_id=channel_id, user_id=user_id,
+                limiter=self.limiter, max_retries=self.max_retries
+            )
+            # Desbanear para que pueda volver a entrar si renueva la suscripción
+            await call_with_retry(
+                bot.unban_chat_member, chat_id=channel_id, user_id=user_id, only_if_banned=True,
+                limiter=self.limiter, max_retries=self.max_retries
+            )
+            return ('removed', None, user_id, channel_id)
+        except BadRequest as e:
+            if 'not found' in str(e).lower() or 'participant' in str(e).lower():
+                return ('not_member', str(e), user_id, channel_id)
+            return ('failed', str(e), user_id, channel_id)
+        except TelegramError as e:
+            return ('failed', str(e), user_id, channel_id)
@@ -1,81 +1,323 @@
 import asyncio
 import time
+from telegram.error import BadRequest, Forbidden, TelegramError
 from bot import AdminBot
+from throttling import call_with_retry
 
-class FreeChannelHandler:
-    def __init__(self):
-        self.admin_bot = AdminBot()
-        self.running = False
-
-    async def process_free_channel_requests(self):
-        while self.running:
-            delay = self.admin_bot.get_free_channel_delay()
-            
-            pending_requests = self.admin_bot.get_pending_free_requests()
-            
-            for user_id, username, requested_at in pending_requests:
-                request_time = time.mktime(time.strptime(requested_at, '%Y-%m-%d %H:%M:%S'))
-                current_time = time.time()
-                
-                if current_time - request_time >= delay:
-                    print(f"Aprobando acceso para usuario {username} (ID: {user_id})")
-                    self.admin_bot.mark_request_processed(user_id, requested_at)
-                    
-            await asyncio.sleep(10)
-
-    def start(self):
-        self.running = True
-        asyncio.create_task(self.process_free_channel_requests())
+class ApprovalWorker:
+    """
+    Aprueba en lotes las solicitudes del canal gratuito cuyo delay ya venció.
+    Las aprobaciones de cada lote se ejecutan concurrentemente bajo un token
+    bucket global, y el lote completo se marca como procesado en una sola
+    transacción, de modo que un pico de miles de solicitudes no provoca
+    bloqueos por flood en Telegram. Entre lotes el worker duerme exactamente
+    hasta el próximo vencimiento, salvo que una solicitud nueva o un cambio
+    de delay lo despierten antes.
+
+    Solo se descartan las solicitudes que Telegram ya no puede aprobar
+    (TERMINAL_ERRORS). Si falta el canal gratuito o el bot no puede aprobar
+    en él, las solicitudes quedan pendientes: sin canal se espera a que se
+    configure uno, y ante errores del canal se reintenta cada channel_retry_delay.
+    """
+
+    # Errores de BadRequest tras los que la solicitud ya no existe o no hace falta aprobarla
+    TERMINAL_ERRORS = ('HIDE_REQUESTER_MISSING', 'USER_ALREADY_PARTICIPANT')
+
+    def __init__(self, admin_bot, limiter, batch_size=100, concurrency=10, retry_delay=30, channel_retry_delay=600):
+        """
+        Args:
+            admin_bot (AsyncAdminBot): Acceso asíncrono a la base de datos
+            limiter (TokenBucket): Limitador global de tasa compartido con el resto de envíos
+            batch_size (int): Solicitudes aprobadas por lote
+            concurrency (int): Aprobaciones simultáneas
+            retry_delay (float): Segundos antes de reintentar solicitudes con error transitorio
+            channel_retry_delay (float): Segundos antes de reintentar tras un error del canal
+                (canal inexistente o bot sin permisos)
+        """
+        self.admin_bot = admin_bot
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retry_delay = retry_delay
+        self.channel_retry_delay = channel_retry_delay
+        self.limiter = limiter
+        # {chat_id: instante hasta el que no se reintenta} tras un error del canal
+        self._channel_errors = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._loop = None
+
+    def start(self, application):
+        """Lanza el bucle del worker en segundo plano"""
+        self._loop = asyncio.get_running_loop()
+        self.admin_bot.config.subscribe(self._on_config_change)
+        # Tarea propia y no de la aplicación: Application.stop() espera a las tareas de
+        # create_task y este bucle no termina; stop() la cancela al apagar el bot
+        self._task = self._loop.create_task(self.run(application.bot))
 
     def stop(self):
-        self.running = False
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def wake(self):
+        """Despierta al worker para que procese las solicitudes vencidas"""
+        self._wakeup.set()
+
+    def reset_channels(self):
+        """Olvida los errores de canal y reintenta ya (p. ej. tras configurar el canal gratuito)"""
+        self._channel_errors.clear()
+        self.wake()
+
+    def _on_config_change(self, key, value):
+        # ConfigCache notifica desde el hilo del executor
+        if key in ('free_channel_delay', None) and self._loop:
+            self._loop.call_soon_threadsafe(self.wake)
+
+    async def run(self, bot):
+        while True:
+            try:
+                timeout = await self.drain(bot)
+            except Exception as e:
+                print(f"Error procesando solicitudes del canal gratuito: {e}")
+                timeout = self.retry_delay
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain(self, bot):
+        """
+        Aprueba lotes de solicitudes vencidas hasta vaciar la cola.
+
+        Returns:
+            float: Segundos hasta el próximo vencimiento, o None si no queda ninguna solicitud
+        """
+        # Solicitudes que siguen pendientes, por motivo: 'retry', 'channel_error' o 'no_channel'
+        held = {}
+        delay = await self.admin_bot.get_free_channel_delay()
+        while True:
+            cutoff = int(time.time()) - delay
+            # Las solicitudes retenidas siguen vencidas: pedir las suficientes para completar un lote
+            limit = self.batch_size + len(held)
+            pending_requests = await self.admin_bot.get_due_free_requests(cutoff, limit)
+            due_requests = [
+                request for request in pending_requests if request[0] not in held
+            ][:self.batch_size]
+            if not due_requests:
+                break
+
+            default_channel = await self.admin_bot.get_channel('free')
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def approve(request):
+                async with semaphore:
+                    return await self._approve(bot, request, default_channel)
+
+            results = await asyncio.gather(*(approve(request) for request in due_requests))
+            resolved = []
+            for request, outcome in zip(due_requests, results):
+                if outcome == 'done':
+                    resolved.append(request[0])
+                else:
+                    held[request[0]] = outcome
+            await self.admin_bot.mark_requests_processed(resolved)
+
+            if len(pending_requests) < limit:
+                break
+
+        next_request_time = await self.admin_bot.get_next_free_request_time(cutoff)
+        timeout = None
+        if next_request_time is not None:
+            timeout = max(0.0, next_request_time + delay - time.time())
+        counts = {}
+        for outcome in held.values():
+            counts[outcome] = counts.get(outcome, 0) + 1
+        if counts.get('no_channel'):
+            # Sin reintentos periódicos: se despierta al worker al configurar el canal
+            print(f"Sin canal gratuito configurado: {counts['no_channel']} solicitudes en espera")
+        now = time.time()
+        blocked_until = [until for until in self._channel_errors.values() if until > now]
+        if counts.get('channel_error') and blocked_until:
+            retry_in = min(blocked_until) - now
+            timeout = retry_in if timeout is None else min(timeout, retry_in)
+        if counts.get('retry'):
+            # Errores transitorios: se reintentan más tarde sin bloquear al resto
+            timeout = self.retry_delay if timeout is None else min(timeout, self.retry_delay)
+        return timeout
+
+    async def _approve(self, bot, request, default_channel):
+        """
+        Returns:
+            str: 'done' si la solicitud quedó resuelta, o el motivo por el que sigue
+                pendiente: 'retry', 'channel_error' o 'no_channel'
+        """
+        request_id, user_id, username, requested_at, chat_id = request
+        if chat_id is None:
+            # Solicitudes anteriores a registrar chat_id: usar el canal gratuito actual
+            if not default_channel:
+                return 'no_channel'
+            chat_id = default_channel[0]
+        if self._channel_errors.get(chat_id, 0) > time.time():
+            # El canal falló hace poco: no insistir hasta channel_retry_delay
+            return 'channel_error'
+
+        try:
+            await call_with_retry(
+                bot.approve_chat_join_request, chat_id=chat_id, user_id=user_id,
+                limiter=self.limiter
+            )
+            print(f"Aprobando acceso para usuario {username} (ID: {user_id})")
+        except BadRequest as e:
+            if any(error in str(e).upper() for error in self.TERMINAL_ERRORS):
+                # La solicitud ya no existe (cancelada o resuelta manualmente): no reintentar
+                print(f"Solicitud de {username} (ID: {user_id}) descartada: {e}")
+                return 'done'
+            # Canal inexistente o bot sin permisos: la solicitud sigue pendiente
+            return self._channel_error(chat_id, e)
+        except Forbidden as e:
+            # El bot ya no pertenece al canal
+            return self._channel_error(chat_id, e)
+        except TelegramError as e:
+            print(f"Error aprobando solicitud de {username} (ID: {user_id}): {e}")
+            return 'retry'
+        return 'done'
 
-    def simulate_request(self, user_id, username):
-        self.admin_bot.add_free_channel_request(user_id, username)
-        print(f"Solicitud simulada para {username} (ID: {user_id})")
+    def _channel_error(self, chat_id, error):
+        if self._channel_errors.get(chat_id, 0) <= time.time():
+            print(f"No se pueden aprobar solicitudes en el canal {chat_id}: {error}. "
+                  f"Verifica que exista y que el bot sea administrador con permiso para añadir miembros; "
+                  f"se reintentará en {self.channel_retry_delay} segundos")
+        self._channel_errors[chat_id] = time.time() + self.channel_retry_delay
+        return 'channel_error'
+
+class FreeChannelHandler:
+    """
+    Aprobación de solicitudes de ingreso al canal gratuito.
+    Las solicitudes entrantes se acumulan brevemente y se registran en lote;
+    tras cada lote se despierta al ApprovalWorker, que calcula en SQL cuáles
+    han vencido y cuándo vence la siguiente. Al iniciar, el worker procesa
+    las solicitudes que quedaron pendientes mientras el bot estaba detenido.
+    """
+
+    def __init__(self, admin_bot, limiter, flush_interval=0.5, retry_delay=5):
+        """
+        Args:
+            admin_bot (AsyncAdminBot): Acceso asíncrono a la base de datos
+            limiter (TokenBucket): Limitador global de tasa para las aprobaciones
+            flush_interval (float): Segundos que se acumulan solicitudes antes de guardarlas
+            retry_delay (float): Segundos antes de reintentar un lote que no se pudo guardar
+        """
+        self.admin_bot = admin_bot
+        self.approval_worker = ApprovalWorker(self.admin_bot, limiter)
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self._incoming = []
+        self._flush_task = None
+
+    async def handle_join_request(self, update, context):
+        """Handler de ChatJoinRequest: registra la solicitud y programa su aprobación"""
+        join_request = update.chat_join_request
+        if not join_request:
+            return
+
+        chat_id = join_request.chat.id
+        free_channels = await self.admin_bot.get_channels('free')
+        if chat_id not in {channel_id for channel_id, channel_name in free_channels}:
+            return
+
+        user = join_request.from_user
+        self._incoming.append((user.id, user.username, chat_id))
+        if self._flush_task is None:
+            # Fuera de Application.create_task: stop() guarda lo pendiente al apagar el bot
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_incoming())
+
+    async def _flush_incoming(self):
+        try:
+            await asyncio.sleep(self.flush_interval)
+            # Las solicitudes que llegan mientras se guarda un lote entran en la siguiente vuelta
+            while self._incoming:
+                if not await self._flush():
+                    await asyncio.sleep(self.retry_delay)
+        finally:
+            self._flush_task = None
+
+    async def _flush(self):
+        """
+        Guarda las solicitudes acumuladas con un solo INSERT.
+
+        Returns:
+            bool: False si no se pudieron guardar; el lote vuelve a la cola en memoria
+        """
+        batch, self._incoming = self._incoming, []
+        if not batch:
+            return True
+
+        try:
+            await self.admin_bot.add_free_channel_requests(batch)
+        except Exception as e:
+            print(f"Error guardando {len(batch)} solicitudes del canal gratuito: {e}")
+            self._incoming[:0] = batch
+            return False
+
+        # El worker recalcula el próximo vencimiento incluyendo el nuevo lote
+        self.approval_worker.wake()
+        return True
+
+    async def start(self, application):
+        """Arranca el worker, que aprueba de inmediato las solicitudes vencidas durante una caída"""
+        self.approval_worker.start(application)
+
+    async def stop(self):
+        """Detiene el worker y guarda las solicitudes que aún no se habían escrito"""
+        self.approval_worker.stop()
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self._flush()
 
 if __name__ == "__main__":
-    handler = FreeChannelHandler()
-    handler.start()
-    
+    admin_bot = AdminBot()
+
     print("Simulador de canal gratuito iniciado...")
     print("Comandos:")
     print("  add <user_id> <username> - Simular solicitud de usuario")
     print("  delay <seconds> - Cambiar delay actual")
     print("  status - Ver estado actual")
     print("  quit - Salir")
-    
+
     try:
         while True:
             command = input("> ").strip().split()
-            
+
             if not command:
                 continue
-                
+
             if command[0] == "add" and len(command) >= 3:
                 user_id = int(command[1])
                 username = command[2]
-                handler.simulate_request(user_id, username)
-                
+                admin_bot.add_free_channel_request(user_id, username)
+                print(f"Solicitud simulada para {username} (ID: {user_id})")
+
             elif command[0] == "delay" and len(command) >= 2:
                 delay_seconds = int(command[1])
-                handler.admin_bot.set_free_channel_delay(delay_seconds)
+                admin_bot.set_free_channel_delay(delay_seconds)
                 print(f"Delay cambiado a {delay_seconds} segundos")
-                
+
             elif command[0] == "status":
-                current_delay = handler.admin_bot.get_free_channel_delay()
-                pending_requests = handler.admin_bot.get_pending_free_requests()
+                current_delay = admin_bot.get_free_channel_delay()
+                pending_requests = admin_bot.get_pending_free_requests()
                 print(f"Delay actual: {current_delay} segundos")
                 print(f"Solicitudes pendientes: {len(pending_requests)}")
-                
+
             elif command[0] == "quit":
                 break
-                
+
             else:
                 print("Comando no reconocido")
-                
+
     except KeyboardInterrupt:
         pass
     finally:
-        handler.stop()
-        print("Simulador detenido")
\ No newline at end of file
+        print("Simulador detenido")
@@ -1,17 +1,55 @@
 import os
 import asyncio
+import time
+from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
-from bot import AdminBot
+from telegram.error import TelegramError
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ChatJoinRequestHandler, ContextTypes, MessageHandler, filters
+from bot import AdminBot, AsyncAdminBot, format_timestamp
 from menu_factory import MenuFactory
+from callback_router import CallbackRouter, encode_callback
+from admin_guard import AdminGuard
+from render_cache import RenderCache
+from subscription_scheduler import SubscriptionScheduler
+from expulsion import ExpulsionWorker
+from free_channel_handler import FreeChannelHandler
+from broadcast import BroadcastWorker
+from reminders import ReminderSender
+from outbox import OutboxDispatcher
+from draft_scheduler import DraftScheduler
+from throttling import TokenBucket, call_with_retry
 
 class TelegramBot:
+    VIP_USERS_PAGE_SIZE = 10
+    # Límite global de Telegram (~30 mensajes/s por bot), compartido por todos los envíos
+    SEND_RATE = 30
+
     def __init__(self):
-        self.admin_bot = AdminBot()
+        # Todas las consultas a SQLite se ejecutan fuera del event loop
+        self.admin_bot = AsyncAdminBot(AdminBot())
         self.token = self.admin_bot.token
         if not self.token:
             raise ValueError("BOT_TOKEN environment variable is required")
         self.app = None
+        self.bot_identity = None
+        self.render_cache = RenderCache()
+        self.limiter = TokenBucket(self.SEND_RATE)
+        self.subscription_scheduler = SubscriptionScheduler(
+            self.admin_bot,
+            on_reminders=self.send_subscription_reminders,
+            on_expired=self.handle_expired_subscriptions
+        )
+        self.expulsion_worker = ExpulsionWorker(self.admin_bot, self.limiter)
+        self.free_channel_handler = FreeChannelHandler(self.admin_bot, self.limiter)
+        self.broadcast_worker = BroadcastWorker(self.admin_bot, self.limiter)
+        self.outbox = OutboxDispatcher(self.admin_bot, self.limiter)
+        self.reminder_sender = ReminderSender(self.admin_bot, self.outbox)
+        self.draft_scheduler = DraftScheduler(self.admin_bot, on_due=self.publish_scheduled_draft)
+        self.callback_router = self.create_callback_router()
+
+    async def edit_menu(self, query, text, reply_markup=None, parse_mode='HTML'):
+        """Muestra un menú editando el mensaje del callback, omitiendo la edición si no cambió"""
+        return await self.render_cache.edit(query, text, reply_markup=reply_markup, parse_mode=parse_mode)
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not update.effective_user:
@@ -23,7 +61,7 @@ class TelegramBot:
             token = context.args[0]
             await self.handle_vip_token(user_id, update.effective_user.username, token, update, context)
         else:
-            if user_id == self.admin_bot.admin_id:
+            if user_id in self.admin_bot.admin_ids:
                 title, reply_markup = MenuFactory.admin_panel()
                 if update.message:
                     await update.message.reply_text(title, reply_markup=reply_markup, parse_mode='HTML')
@@ -50,31 +88,32 @@ class TelegramBot:
         # Verificar estado de envío de mensaje
         elif context.user_data.get('awaiting_message_text'):
             await self.handle_message_text_input(update, context)
+        elif context.user_data.get('awaiting_schedule_time'):
+            await self.handle_schedule_time_input(update, context)
 
     async def handle_vip_token(self, user_id: int, username: str | None, token: str, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if self.admin_bot.validate_vip_token(token):
+        if await self.admin_bot.validate_vip_token(token):
             # Obtener la duración del token antes de registrarlo
-            import sqlite3
-            conn = sqlite3.connect(self.admin_bot.database_path)
-            cursor = conn.cursor()
-            cursor.execute('SELECT duration_days FROM vip_tokens WHERE token = ?', (token,))
-            token_data = cursor.fetchone()
-            duration_days = token_data[0] if token_data else 30
-            conn.close()
+            duration_days = await self.admin_bot.get_token_duration(token)
             
-            # Registrar al usuario VIP
-            self.admin_bot.register_vip_user(user_id, username or f"ID: {user_id}", token)
+            # Registrar al usuario VIP y programar su recordatorio y expiración
+            subscription_end = await self.admin_bot.register_vip_user(user_id, username or f"ID: {user_id}", token)
+            self.subscription_scheduler.schedule(user_id, subscription_end)
             
             # Obtener el canal VIP
-            vip_channel = self.admin_bot.get_channel('vip')
+            vip_channel = await self.admin_bot.get_channel('vip')
             
             if update.message:
-                # Mensaje de confirmación
-                await update.message.reply_text(
-                    f"¡Felicidades! 🎉 Has sido registrado como usuario VIP.\n"
-                    f"Tu suscripción es válida por {duration_days} días.\n\n"
-                    f"Recibirás un recordatorio un día antes de que expire tu suscripción."
-                )
+                # El token ya se consumió: la bienvenida y el acceso se envían por la cola
+                # para que un error de Telegram o un reinicio no los pierdan
+                chat_id = update.message.chat_id
+                messages = [(
+                    'message', chat_id,
+                    {'text': f"¡Felicidades! 🎉 Has sido registrado como usuario VIP.\n"
+                             f"Tu suscripción es válida por {duration_days} días.\n\n"
+                             f"Recibirás un recordatorio un día antes de que expire tu suscripción."},
+                    f"vip_welcome:{token}"
+                )]
                 
                 # Generar y enviar invitación al canal VIP si existe
                 if vip_channel:
@@ -85,7 +124,6 @@ class TelegramBot:
                     try:
                         # Intentar obtener información del bot para crear el enlace
                         if self.app and self.app.bot:
-                            bot_username = (await self.app.bot.get_me()).username
                             # Crear un enlace de invitación temporal
                             invite_link = await self.app.bot.create_chat_invite_link(
                                 chat_id=channel_id,
@@ -93,31 +131,40 @@ class TelegramBot:
                                 name=f"VIP Access for {username or user_id}"
                             )
                             
-                            await update.message.reply_text(
+                            access_text = (
                                 f"🔗 Aquí está tu enlace de acceso al canal VIP:\n"
                                 f"{invite_link.invite_link}\n\n"
                                 f"<b>{channel_name}</b>\n"
-                                f"¡Bienvenido/a! 🎊",
-                                parse_mode='HTML'
+                                f"¡Bienvenido/a! 🎊"
                             )
                         else:
                             # Fallback: usar formato estándar si no podemos crear enlace personalizado
-                            await update.message.reply_text(
+                            access_text = (
                                 f"🔗 Para acceder al canal VIP:\n"
                                 f"<b>{channel_name}</b>\n\n"
-                                f"Contacta al administrador para obtener acceso directo.",
-                                parse_mode='HTML'
+                                f"Contacta al administrador para obtener acceso directo."
                             )
+                        messages.append((
+                            'message', chat_id, {'text': access_text, 'parse_mode': 'HTML'}, f"vip_access:{token}"
+                        ))
                     except Exception as e:
                         print(f"Error al crear invitación: {e}")
-                        await update.message.reply_text(
-                            f"⚠️ No se pudo generar la invitación automática.\n"
-                            f"Contacta al administrador para acceder al canal VIP: {channel_name}"
-                        )
+                        messages.append((
+                            'message', chat_id,
+                            {'text': f"⚠️ No se pudo generar la invitación automática.\n"
+                                     f"Contacta al administrador para acceder al canal VIP: {channel_name}"},
+                            f"vip_access:{token}"
+                        ))
                 else:
-                    await update.message.reply_text(
-                        "⚠️ No hay canal VIP configurado. Contacta al administrador."
-                    )
+                    messages.append((
+                        'message', chat_id,
+                        {'text': "⚠️ No hay canal VIP configurado. Contacta al administrador."},
+                        f"vip_access:{token}"
+                    ))
+                
+                # Uno tras otro, para que la bienvenida llegue antes que el acceso
+                for message in messages:
+                    await self.outbox.send(context.bot, [message])
         else:
             if update.message:
                 await update.message.reply_text("❌ Token inválido o ya utilizado.")
@@ -128,12 +175,8 @@ class TelegramBot:
             return
         await query.answer()
         
-        if not update.effective_user or update.effective_user.id != self.admin_bot.admin_id:
-            await query.edit_message_text("No tienes permisos de administrador.")
-            return
-        
         title, reply_markup = MenuFactory.admin_panel()
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def admin_vip(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -141,12 +184,8 @@ class TelegramBot:
             return
         await query.answer()
         
-        if not update.effective_user or update.effective_user.id != self.admin_bot.admin_id:
-            await query.edit_message_text("No tienes permisos de administrador.")
-            return
-        
         title, reply_markup = MenuFactory.admin_vip()
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def admin_free(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -154,12 +193,8 @@ class TelegramBot:
             return
         await query.answer()
         
-        if not update.effective_user or update.effective_user.id != self.admin_bot.admin_id:
-            await query.edit_message_text("No tienes permisos de administrador.")
-            return
-        
         title, reply_markup = MenuFactory.admin_free()
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def admin_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -167,12 +202,8 @@ class TelegramBot:
             return
         await query.answer()
         
-        if not update.effective_user or update.effective_user.id != self.admin_bot.admin_id:
-            await query.edit_message_text("No tienes permisos de administrador.")
-            return
-        
         title, reply_markup = MenuFactory.admin_stats()
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def admin_config(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -180,12 +211,8 @@ class TelegramBot:
             return
         await query.answer()
         
-        if not update.effective_user or update.effective_user.id != self.admin_bot.admin_id:
-            await query.edit_message_text("No tienes permisos de administrador.")
-            return
-        
         title, reply_markup = MenuFactory.admin_config()
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def config_delay(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -193,13 +220,13 @@ class TelegramBot:
             return
         await query.answer()
         
-        current_delay = self.admin_bot.get_free_channel_delay()
+        current_delay = await self.admin_bot.get_free_channel_delay()
         title, reply_markup = MenuFactory.config_delay()
         
         # Personalizar el título con el delay actual
         title = title.replace("Selecciona el tiempo de espera:", f"Delay actual: {current_delay} segundos\n\nSelecciona el tiempo de espera:")
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def set_delay(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -207,8 +234,8 @@ class TelegramBot:
             return
         await query.answer()
         
-        delay_seconds = query.data.replace('set_delay_', '')
-        self.admin_bot.set_free_channel_delay(delay_seconds)
+        delay_seconds = context.args[0]
+        await self.admin_bot.set_free_channel_delay(delay_seconds)
         
         title, reply_markup = MenuFactory.create_simple_message(
             "✅ Configuración Actualizada",
@@ -216,7 +243,7 @@ class TelegramBot:
             "system_config"
         )
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def generate_vip_token(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -225,7 +252,7 @@ class TelegramBot:
         await query.answer()
         
         # Obtener tarifas disponibles
-        rates = self.admin_bot.get_vip_rates()
+        rates = await self.admin_bot.get_vip_rates()
         
         if not rates:
             title, reply_markup = MenuFactory.create_simple_message(
@@ -250,12 +277,12 @@ class TelegramBot:
             for rate_id, name, days, cost, is_active in rates:
                 if is_active:
                     button_text = f"🎫 {name} - {days}d - ${cost:.2f}"
-                    keyboard.append([InlineKeyboardButton(button_text, callback_data=f"generate_token_rate_{rate_id}")])
+                    keyboard.append([InlineKeyboardButton(button_text, callback_data=encode_callback('generate_token_rate', rate_id))])
             
             keyboard.append([InlineKeyboardButton("← Volver", callback_data="vip_management")])
             reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def generate_token_for_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Genera un token VIP para una tarifa específica"""
@@ -265,17 +292,17 @@ class TelegramBot:
         await query.answer()
         
         # Extraer el ID de la tarifa
-        rate_id = int(query.data.replace('generate_token_rate_', ''))
+        rate_id = int(context.args[0])
         
         # Obtener información de la tarifa
-        rate = self.admin_bot.get_vip_rate(rate_id)
+        rate = await self.admin_bot.get_vip_rate(rate_id)
         if not rate:
             title, reply_markup = MenuFactory.create_simple_message(
                 "❌ Error",
                 "La tarifa seleccionada no existe.",
                 "generate_vip_token"
             )
-            await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+            await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
             return
         
         rate_id, name, days, cost, is_active = rate
@@ -286,15 +313,15 @@ class TelegramBot:
                 "La tarifa seleccionada no está activa.",
                 "generate_vip_token"
             )
-            await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+            await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
             return
         
         # Generar token con la duración de la tarifa
-        token = self.admin_bot.generate_vip_token(duration_days=days)
+        token = await self.admin_bot.generate_vip_token(duration_days=days)
         
         # Crear enlace de invitación
         if self.app and self.app.bot:
-            bot_username = (await self.app.bot.get_me()).username
+            bot_username = await self.get_bot_username()
             invite_link = f"https://t.me/{bot_username}?start={token}"
         else:
             invite_link = f"Token: {token}"
@@ -320,37 +347,34 @@ class TelegramBot:
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def view_vip_users(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Listado paginado de usuarios VIP: vip_users:<filtro>[:next|prev:<subscription_end>:<user_id>]"""
         query = update.callback_query
         if not query:
             return
         await query.answer()
         
-        users = self.admin_bot.get_vip_users()
+        args = context.args or []
+        status_filter = args[0] if args and args[0] in ('active', 'expired') else 'all'
+        after = before = None
+        if len(args) == 4:
+            cursor = (int(args[2]), int(args[3]))
+            if args[1] == 'prev':
+                before = cursor
+            else:
+                after = cursor
         
-        if not users:
-            title, reply_markup = MenuFactory.create_simple_message(
-                "👥 Usuarios VIP",
-                "No hay usuarios VIP registrados.",
-                "vip_management"
-            )
-        else:
-            message = ""
-            for user in users:
-                user_id, username, sub_end, status = user
-                message += f"👤 {username or f'ID: {user_id}'}\n"
-                message += f"   Estado: {status}\n"
-                message += f"   Vence: {sub_end}\n\n"
-            
-            title, reply_markup = MenuFactory.create_simple_message(
-                "👥 Usuarios VIP",
-                message,
-                "vip_management"
-            )
+        users, has_prev, has_next = await self.admin_bot.get_vip_users_page(
+            status=None if status_filter == 'all' else status_filter,
+            after=after,
+            before=before,
+            limit=self.VIP_USERS_PAGE_SIZE
+        )
+        title, reply_markup = MenuFactory.vip_users_page(users, status_filter, has_prev, has_next, format_timestamp)
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def manage_channels(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -358,22 +382,15 @@ class TelegramBot:
             return
         await query.answer()
         
-        if not update.effective_user or update.effective_user.id != self.admin_bot.admin_id:
-            await query.edit_message_text("No tienes permisos de administrador.")
-            return
+        # El menú solo se reconstruye cuando cambia el registro de canales
+        version = self.admin_bot.channels.version
+        menu = MenuFactory.cached('manage_channels', version)
+        if menu is None:
+            channels = await self.admin_bot.get_all_channels()
+            menu = MenuFactory.store('manage_channels', version, MenuFactory.manage_channels_status(channels))
+        title, reply_markup = menu
         
-        channels = self.admin_bot.get_all_channels()
-        title, reply_markup = MenuFactory.manage_channels()
-        
-        # Personalizar el título con información de canales
-        if channels:
-            channels_info = "\n<b>Canales Configurados:</b>\n"
-            for channel_id, channel_name, channel_type, is_active in channels:
-                status = "🟢 Activo" if is_active else "🔴 Inactivo"
-                channels_info += f"• {channel_name} ({channel_type.upper()}) - {status}\n"
-            title = title.replace("Selecciona una opción:", channels_info + "\nSelecciona una opción:")
-        
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def add_free_channel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -391,7 +408,7 @@ class TelegramBot:
             "manage_channels"
         )
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
         if context.user_data is not None:
             context.user_data['awaiting_channel'] = 'free'
 
@@ -411,7 +428,7 @@ class TelegramBot:
             "manage_channels"
         )
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
         if context.user_data is not None:
             context.user_data['awaiting_channel'] = 'vip'
 
@@ -421,35 +438,16 @@ class TelegramBot:
             return
         await query.answer()
         
-        channels = self.admin_bot.get_all_channels()
-        
-        if not channels:
-            title, reply_markup = MenuFactory.create_simple_message(
-                "📋 Canales Configurados",
-                "No hay canales configurados.",
-                "manage_channels"
-            )
-        else:
-            message = ""
-            for channel_id, channel_name, channel_type, is_active in channels:
-                status = "🟢 Activo" if is_active else "🔴 Inactivo"
-                message += f"<b>{channel_name}</b>\n"
-                message += f"ID: <code>{channel_id}</code>\n"
-                message += f"Tipo: {channel_type.upper()}\n"
-                message += f"Estado: {status}\n\n"
-            
-            title, reply_markup = MenuFactory.create_simple_message(
-                "📋 Canales Configurados",
-                message,
-                "manage_channels"
-            )
+        version = self.admin_bot.channels.version
+        menu = MenuFactory.cached('view_channels', version)
+        if menu is None:
+            channels = await self.admin_bot.get_all_channels()
+            menu = MenuFactory.store('view_channels', version, MenuFactory.view_channels_list(channels))
+        title, reply_markup = menu
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def handle_forwarded_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if not update.effective_user or update.effective_user.id != self.admin_bot.admin_id:
-            return
-        
         if context.user_data is None or 'awaiting_channel' not in context.user_data:
             return
         
@@ -460,7 +458,10 @@ class TelegramBot:
             channel_id = channel.id
             channel_name = channel.title
             
-            self.admin_bot.add_channel(channel_id, channel_name, channel_type)
+            await self.admin_bot.add_channel(channel_id, channel_name, channel_type)
+            if channel_type == 'free':
+                # Las solicitudes retenidas por falta de canal o por sus errores se reintentan ya
+                self.free_channel_handler.approval_worker.reset_channels()
             
             title, reply_markup = MenuFactory.create_simple_message(
                 f"✅ Canal {channel_type.upper()} Configurado",
@@ -484,21 +485,14 @@ class TelegramBot:
             if update.message:
                 await update.message.reply_text(title, reply_markup=reply_markup, parse_mode='HTML')
 
-    async def check_subscriptions(self, context: ContextTypes.DEFAULT_TYPE):
-        expiring_users = self.admin_bot.get_expiring_vip_users()
-        
-        for user_id, username, sub_end in expiring_users:
-            try:
-                await context.bot.send_message(
-                    user_id,
-                    f"¡Recordatorio! Tu suscripción VIP expira en menos de 24 horas.\n"
-                    f"Fecha de expiración: {sub_end}\n\n"
-                    f"Renueva tu suscripción para mantener el acceso al canal VIP."
-                )
-            except Exception as e:
-                print(f"Error enviando recordatorio a {user_id}: {e}")
-        
-        self.admin_bot.expire_old_subscriptions()
+    async def send_subscription_reminders(self, context: ContextTypes.DEFAULT_TYPE, expiring_users):
+        # Solo se reservan y encolan (la cola outbox los entrega en segundo plano):
+        # si falla, el error llega al planificador, que vuelve a intentarlo
+        await self.reminder_sender.send(expiring_users)
+
+    async def handle_expired_subscriptions(self, context: ContextTypes.DEFAULT_TYPE, user_ids):
+        # La expulsión puede tardar con miles de usuarios: se ejecuta en segundo plano
+        self.expulsion_worker.spawn(self.expulsion_worker.expel(context.bot, user_ids))
 
     # Nuevas funciones para menús factory
     async def system_config(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -508,7 +502,7 @@ class TelegramBot:
         await query.answer()
         
         title, reply_markup = MenuFactory.system_config()
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def vip_management(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -517,7 +511,7 @@ class TelegramBot:
         await query.answer()
         
         title, reply_markup = MenuFactory.vip_management()
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def statistics(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -526,7 +520,7 @@ class TelegramBot:
         await query.answer()
         
         title, reply_markup = MenuFactory.statistics()
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     # Funciones para gestión de tarifas VIP
     async def manage_rates(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -536,7 +530,7 @@ class TelegramBot:
         await query.answer()
         
         title, reply_markup = MenuFactory.manage_rates()
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def select_rate_duration(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -545,7 +539,7 @@ class TelegramBot:
         await query.answer()
         
         title, reply_markup = MenuFactory.select_rate_duration()
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def handle_rate_duration(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -553,7 +547,7 @@ class TelegramBot:
             return
         await query.answer()
         
-        duration_days = int(query.data.replace('rate_duration_', ''))
+        duration_days = int(context.args[0])
         if context.user_data is not None:
             context.user_data['rate_duration'] = duration_days
         
@@ -565,7 +559,7 @@ class TelegramBot:
             "select_rate_duration"
         )
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
         if context.user_data is not None:
             context.user_data['awaiting_rate_cost'] = True
 
@@ -640,7 +634,7 @@ class TelegramBot:
         duration = context.user_data['rate_duration']
         cost = context.user_data['rate_cost']
         
-        self.admin_bot.add_vip_rate(name, duration, cost)
+        await self.admin_bot.add_vip_rate(name, duration, cost)
         
         # Limpiar datos temporales
         for key in ['rate_duration', 'rate_cost', 'rate_name', 'awaiting_rate_cost', 'awaiting_rate_name']:
@@ -664,12 +658,15 @@ class TelegramBot:
             return
         await query.answer()
         
-        rates = self.admin_bot.get_vip_rates()
-        
-        # Pasar la lista de tarifas directamente para que se muestren como botones inline
-        title, reply_markup = MenuFactory.view_rates_list(rates)
+        # El listado solo se reconstruye cuando cambian las tarifas
+        version = self.admin_bot.rates_version
+        menu = MenuFactory.cached('view_rates', version)
+        if menu is None:
+            rates = await self.admin_bot.get_vip_rates()
+            menu = MenuFactory.store('view_rates', version, MenuFactory.view_rates_list(rates))
+        title, reply_markup = menu
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def edit_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -679,8 +676,8 @@ class TelegramBot:
         
         if not query.data:
             return
-        rate_id = int(query.data.replace('edit_rate_', ''))
-        rate = self.admin_bot.get_vip_rate(rate_id)
+        rate_id = int(context.args[0])
+        rate = await self.admin_bot.get_vip_rate(rate_id)
         
         if not rate:
             title, reply_markup = MenuFactory.create_simple_message(
@@ -688,7 +685,7 @@ class TelegramBot:
                 "La tarifa no existe.",
                 "view_rates"
             )
-            await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+            await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
             return
         
         rate_id, name, days, cost, is_active = rate
@@ -701,16 +698,16 @@ class TelegramBot:
         title += "Selecciona una acción:"
         
         keyboard = [
-            [InlineKeyboardButton("✏️ Cambiar Nombre", callback_data=f"change_rate_name_{rate_id}")],
-            [InlineKeyboardButton("⏱️ Cambiar Duración", callback_data=f"change_rate_duration_{rate_id}")],
-            [InlineKeyboardButton("💰 Cambiar Costo", callback_data=f"change_rate_cost_{rate_id}")],
-            [InlineKeyboardButton("🔄 Cambiar Estado", callback_data=f"toggle_rate_status_{rate_id}")],
-            [InlineKeyboardButton("🗑️ Eliminar Tarifa", callback_data=f"delete_rate_{rate_id}")],
+            [InlineKeyboardButton("✏️ Cambiar Nombre", callback_data=encode_callback('change_rate_name', rate_id))],
+            [InlineKeyboardButton("⏱️ Cambiar Duración", callback_data=encode_callback('change_rate_duration', rate_id))],
+            [InlineKeyboardButton("💰 Cambiar Costo", callback_data=encode_callback('change_rate_cost', rate_id))],
+            [InlineKeyboardButton("🔄 Cambiar Estado", callback_data=encode_callback('toggle_rate_status', rate_id))],
+            [InlineKeyboardButton("🗑️ Eliminar Tarifa", callback_data=encode_callback('delete_rate', rate_id))],
             [InlineKeyboardButton("← Volver", callback_data="view_rates")]
         ]
         
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def toggle_rate_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -720,8 +717,8 @@ class TelegramBot:
         
         if not query.data:
             return
-        rate_id = int(query.data.replace('toggle_rate_status_', ''))
-        rate = self.admin_bot.get_vip_rate(rate_id)
+        rate_id = int(context.args[0])
+        rate = await self.admin_bot.get_vip_rate(rate_id)
         
         if not rate:
             title, reply_markup = MenuFactory.create_simple_message(
@@ -729,13 +726,13 @@ class TelegramBot:
                 "La tarifa no existe.",
                 "view_rates"
             )
-            await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+            await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
             return
         
         rate_id, name, days, cost, is_active = rate
         new_status = not is_active
         
-        self.admin_bot.toggle_vip_rate_status(rate_id, new_status)
+        await self.admin_bot.toggle_vip_rate_status(rate_id, new_status)
         
         status_text = "activada" if new_status else "desactivada"
         
@@ -745,7 +742,7 @@ class TelegramBot:
             "view_rates"
         )
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def delete_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -755,8 +752,8 @@ class TelegramBot:
         
         if not query.data:
             return
-        rate_id = int(query.data.replace('delete_rate_', ''))
-        rate = self.admin_bot.get_vip_rate(rate_id)
+        rate_id = int(context.args[0])
+        rate = await self.admin_bot.get_vip_rate(rate_id)
         
         if not rate:
             title, reply_markup = MenuFactory.create_simple_message(
@@ -764,7 +761,7 @@ class TelegramBot:
                 "La tarifa no existe.",
                 "view_rates"
             )
-            await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+            await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
             return
         
         rate_id, name, days, cost, is_active = rate
@@ -775,11 +772,11 @@ class TelegramBot:
             f"• Duración: {days} días\n"
             f"• Costo: ${cost:.2f}\n\n"
             "<b>Esta acción no se puede deshacer.</b>",
-            f"confirm_delete_rate_{rate_id}",
-            f"edit_rate_{rate_id}"
+            encode_callback('confirm_delete_rate', rate_id),
+            encode_callback('edit_rate', rate_id)
         )
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def confirm_delete_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -789,8 +786,8 @@ class TelegramBot:
         
         if not query.data:
             return
-        rate_id = int(query.data.replace('confirm_delete_rate_', ''))
-        rate = self.admin_bot.get_vip_rate(rate_id)
+        rate_id = int(context.args[0])
+        rate = await self.admin_bot.get_vip_rate(rate_id)
         
         if not rate:
             title, reply_markup = MenuFactory.create_simple_message(
@@ -798,12 +795,12 @@ class TelegramBot:
                 "La tarifa no existe.",
                 "view_rates"
             )
-            await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+            await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
             return
         
         rate_id, name, days, cost, is_active = rate
         
-        self.admin_bot.delete_vip_rate(rate_id)
+        await self.admin_bot.delete_vip_rate(rate_id)
         
         title, reply_markup = MenuFactory.create_simple_message(
             "✅ Tarifa Eliminada",
@@ -811,7 +808,7 @@ class TelegramBot:
             "view_rates"
         )
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def change_rate_name(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -821,7 +818,7 @@ class TelegramBot:
         
         if not query.data:
             return
-        rate_id = int(query.data.replace('change_rate_name_', ''))
+        rate_id = int(context.args[0])
         
         if context.user_data is not None:
             context.user_data['editing_rate_id'] = rate_id
@@ -830,10 +827,10 @@ class TelegramBot:
         title, reply_markup = MenuFactory.create_simple_message(
             "✏️ Cambiar Nombre",
             "Envía el nuevo nombre para la tarifa:",
-            f"edit_rate_{rate_id}"
+            encode_callback('edit_rate', rate_id)
         )
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def change_rate_duration(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -843,13 +840,13 @@ class TelegramBot:
         
         if not query.data:
             return
-        rate_id = int(query.data.replace('change_rate_duration_', ''))
+        rate_id = int(context.args[0])
         
         if context.user_data is not None:
             context.user_data['editing_rate_id'] = rate_id
         
         title, reply_markup = MenuFactory.select_rate_duration()
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def change_rate_cost(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -859,7 +856,7 @@ class TelegramBot:
         
         if not query.data:
             return
-        rate_id = int(query.data.replace('change_rate_cost_', ''))
+        rate_id = int(context.args[0])
         
         if context.user_data is not None:
             context.user_data['editing_rate_id'] = rate_id
@@ -868,10 +865,10 @@ class TelegramBot:
         title, reply_markup = MenuFactory.create_simple_message(
             "💰 Cambiar Costo",
             "Envía el nuevo costo para la tarifa (ejemplo: 10.50):",
-            f"edit_rate_{rate_id}"
+            encode_callback('edit_rate', rate_id)
         )
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def handle_rate_name_edit(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if context.user_data is None or not context.user_data.get('awaiting_rate_name_edit'):
@@ -883,7 +880,7 @@ class TelegramBot:
         rate_id = context.user_data['editing_rate_id']
         new_name = update.message.text.strip()
         
-        self.admin_bot.update_vip_rate(rate_id, name=new_name)
+        await self.admin_bot.update_vip_rate(rate_id, name=new_name)
         
         # Limpiar datos temporales
         for key in ['editing_rate_id', 'awaiting_rate_name_edit']:
@@ -892,7 +889,7 @@ class TelegramBot:
         title, reply_markup = MenuFactory.create_simple_message(
             "✅ Nombre Actualizado",
             f"El nombre de la tarifa ha sido cambiado a: <b>{new_name}</b>",
-            f"edit_rate_{rate_id}"
+            encode_callback('edit_rate', rate_id)
         )
         
         await update.message.reply_text(title, reply_markup=reply_markup, parse_mode='HTML')
@@ -910,7 +907,7 @@ class TelegramBot:
                 raise ValueError("El costo debe ser mayor a 0")
             
             rate_id = context.user_data['editing_rate_id']
-            self.admin_bot.update_vip_rate(rate_id, cost=new_cost)
+            await self.admin_bot.update_vip_rate(rate_id, cost=new_cost)
             
             # Limpiar datos temporales
             for key in ['editing_rate_id', 'awaiting_rate_cost_edit']:
@@ -919,7 +916,7 @@ class TelegramBot:
             title, reply_markup = MenuFactory.create_simple_message(
                 "✅ Costo Actualizado",
                 f"El costo de la tarifa ha sido cambiado a: <b>${new_cost:.2f}</b>",
-                f"edit_rate_{rate_id}"
+                encode_callback('edit_rate', rate_id)
             )
             
             await update.message.reply_text(title, reply_markup=reply_markup, parse_mode='HTML')
@@ -928,7 +925,7 @@ class TelegramBot:
             title, reply_markup = MenuFactory.create_simple_message(
                 "❌ Error",
                 "Por favor ingresa un precio válido (ejemplo: 10.50)",
-                f"edit_rate_{context.user_data.get('editing_rate_id', 0)}" if context.user_data and 'editing_rate_id' in context.user_data else "view_rates"
+                encode_callback('edit_rate', context.user_data.get('editing_rate_id', 0)) if context.user_data and 'editing_rate_id' in context.user_data else "view_rates"
             )
             if update.message:
                 await update.message.reply_text(title, reply_markup=reply_markup, parse_mode='HTML')
@@ -958,7 +955,7 @@ class TelegramBot:
             "admin_vip"
         )
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def send_to_free_channel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Inicia el flujo de envío de mensaje al canal gratuito"""
@@ -984,7 +981,7 @@ class TelegramBot:
             "admin_free"
         )
         
-        await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def handle_message_text_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Maneja la entrada del texto del mensaje"""
@@ -1051,7 +1048,7 @@ class TelegramBot:
                 f"send_to_{channel_type}_channel"
             )
             
-            await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+            await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
             
         elif query.data == 'no_file':
             context.user_data['awaiting_file_choice'] = False
@@ -1076,7 +1073,7 @@ class TelegramBot:
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+            await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def handle_file_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Maneja la entrada de archivo adjunto"""
@@ -1158,7 +1155,7 @@ class TelegramBot:
         disable_downloads = query.data == 'disable_downloads'
         
         # Guardar borrador del mensaje
-        draft_id = self.admin_bot.save_message_draft(
+        draft_id = await self.admin_bot.save_message_draft(
             channel_type=channel_type,
             message_text=message_text,
             file_id=file_id,
@@ -1170,6 +1167,20 @@ class TelegramBot:
         context.user_data['awaiting_download_restriction'] = False
         context.user_data['awaiting_confirmation'] = True
         
+        draft = await self.admin_bot.get_message_draft(draft_id)
+        preview_text, reply_markup = await self.render_draft_preview(draft)
+        await self.edit_menu(query, preview_text, reply_markup=reply_markup, parse_mode='HTML')
+
+    async def render_draft_preview(self, draft):
+        """
+        Vista previa de un borrador con sus canales de destino y las acciones de envío.
+        
+        Returns:
+            tuple: (texto, reply_markup)
+        """
+        draft_id, channel_type, message_text, file_path, file_id, file_type, disable_downloads, created_at, send_at = draft
+        channels = await self.admin_bot.get_draft_channels(draft_id, channel_type)
+        
         # Crear vista previa del mensaje
         preview_text = f"<b>📝 Vista Previa - Canal {channel_type.upper()}</b>\n\n"
         preview_text += f"<b>Texto del mensaje:</b>\n{message_text}\n\n"
@@ -1179,18 +1190,63 @@ class TelegramBot:
         else:
             preview_text += "<b>Archivo adjunto:</b> No\n"
         
-        preview_text += f"<b>Descargas:</b> {'🔒 Deshabilitadas' if disable_downloads else '🔓 Permitidas'}\n\n"
+        preview_text += f"<b>Descargas:</b> {'🔒 Deshabilitadas' if disable_downloads else '🔓 Permitidas'}\n"
+        preview_text += f"<b>Canales:</b> {', '.join(channel_name for channel_id, channel_name in channels) or 'Ninguno activo'}\n\n"
         preview_text += "<i>¿Deseas enviar este mensaje al canal?</i>"
         
         # Crear botones de confirmación
         keyboard = [
             [InlineKeyboardButton("✅ Enviar Mensaje", callback_data="confirm_send_message")],
+            [InlineKeyboardButton("📡 Elegir Canales", callback_data="draft_channels")],
+            [InlineKeyboardButton("🕒 Programar Envío", callback_data="schedule_options")],
+            [InlineKeyboardButton("📣 Difundir a Suscriptores", callback_data="broadcast_audience")],
             [InlineKeyboardButton("✏️ Editar Mensaje", callback_data="edit_message")],
             [InlineKeyboardButton("❌ Cancelar", callback_data=f"admin_{channel_type}")]
         ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        return preview_text, InlineKeyboardMarkup(keyboard)
+
+    async def show_draft_preview(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Vuelve a la vista previa del borrador en curso"""
+        query = update.callback_query
+        if not query:
+            return
+        await query.answer()
+        
+        if context.user_data is None or not context.user_data.get('awaiting_confirmation'):
+            return
         
-        await query.edit_message_text(preview_text, reply_markup=reply_markup, parse_mode='HTML')
+        draft = await self.admin_bot.get_message_draft(context.user_data['draft_id'])
+        if not draft:
+            return
+        preview_text, reply_markup = await self.render_draft_preview(draft)
+        await self.edit_menu(query, preview_text, reply_markup=reply_markup, parse_mode='HTML')
+
+    async def select_draft_channels(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Muestra los canales de destino del borrador y añade o quita el canal pulsado"""
+        query = update.callback_query
+        if not query:
+            return
+        await query.answer()
+        
+        if context.user_data is None or not context.user_data.get('awaiting_confirmation'):
+            return
+        
+        draft_id = context.user_data['draft_id']
+        channel_type = context.user_data['posting_channel']
+        selected_ids = {
+            channel_id for channel_id, channel_name in await self.admin_bot.get_draft_channels(draft_id, channel_type)
+        }
+        
+        if context.args:
+            channel_id = int(context.args[0])
+            toggled = selected_ids ^ {channel_id}
+            # Siempre debe quedar al menos un canal de destino
+            if toggled:
+                selected_ids = toggled
+                await self.admin_bot.set_draft_channels(draft_id, sorted(selected_ids))
+        
+        title, reply_markup = MenuFactory.draft_channels(await self.admin_bot.get_all_channels(), selected_ids)
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
 
     async def handle_message_confirmation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Maneja la confirmación y envío del mensaje"""
@@ -1207,49 +1263,29 @@ class TelegramBot:
         
         if query.data == 'confirm_send_message':
             # Obtener datos del borrador
-            draft = self.admin_bot.get_message_draft(draft_id)
+            draft = await self.admin_bot.get_message_draft(draft_id)
             if not draft:
                 title, reply_markup = MenuFactory.create_simple_message(
                     "❌ Error",
                     "No se pudo encontrar el borrador del mensaje.",
                     f"admin_{channel_type}"
                 )
-                await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+                await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
                 return
             
-            draft_id, channel_type, message_text, file_path, file_id, file_type, disable_downloads, created_at = draft
+            results = await self.publish_draft(context.bot, draft)
             
-            # Enviar mensaje al canal
-            success = await self.admin_bot.send_message_to_channel(
-                channel_type=channel_type,
-                message_text=message_text,
-                file_id=file_id,
-                file_type=file_type,
-                disable_downloads=disable_downloads,
-                context=context
-            )
-            
-            if success:
-                # Eliminar borrador
-                self.admin_bot.delete_message_draft(draft_id)
-                
+            retry_callback = None
+            if results and all(status in ('sent', 'pending') for channel_id, channel_name, status in results):
                 # Limpiar datos temporales
                 for key in ['posting_channel', 'message_text', 'file_id', 'file_type', 'draft_id', 'awaiting_confirmation']:
                     context.user_data.pop(key, None)
-                
-                title, reply_markup = MenuFactory.create_simple_message(
-                    "✅ Mensaje Enviado",
-                    f"El mensaje ha sido enviado exitosamente al canal {channel_type.upper()}.",
-                    f"admin_{channel_type}"
-                )
-            else:
-                title, reply_markup = MenuFactory.create_simple_message(
-                    "❌ Error",
-                    "No se pudo enviar el mensaje al canal. Verifica que el bot tenga permisos de administrador en el canal.",
-                    f"admin_{channel_type}"
-                )
+            elif results:
+                # El borrador se conserva: reintentar solo reenvía a los canales fallidos
+                retry_callback = "confirm_send_message"
             
-            await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+            title, reply_markup = MenuFactory.publish_summary(results, f"admin_{channel_type}", retry_callback)
+            await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
             
         elif query.data == 'edit_message':
             # Volver al inicio del flujo
@@ -1265,62 +1301,430 @@ class TelegramBot:
                 f"admin_{channel_type}"
             )
             
-            await query.edit_message_text(title, reply_markup=reply_markup, parse_mode='HTML')
+            await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
+
+    async def publish_draft(self, bot, draft):
+        """
+        Publica un borrador en todos sus canales de destino a la vez, a través de la
+        cola de salida (envíos concurrentes bajo su limitador). El archivo adjunto se
+        reutiliza por file_id, sin volver a subirlo. El borrador se elimina si quedó
+        publicado o en cola en todos los canales.
+        
+        Args:
+            bot (Bot): Bot de Telegram
+            draft (tuple): Fila devuelta por get_message_draft
+        
+        Returns:
+            list: [(channel_id, channel_name, status), ...] con el estado del mensaje en la cola
+                ('sent', 'pending', 'blocked', 'dead'); vacía si no hay canales activos
+        """
+        draft_id, channel_type, message_text, file_path, file_id, file_type, disable_downloads, created_at, send_at = draft
+        
+        channels = await self.admin_bot.get_draft_channels(draft_id, channel_type)
+        if not channels:
+            return []
+        
+        payload = {
+            'message_text': message_text,
+            'file_id': file_id,
+            'file_type': file_type,
+            'disable_downloads': bool(disable_downloads)
+        }
+        # Si Telegram falla, el mensaje se reintenta en segundo plano. La clave por canal
+        # evita publicar dos veces en un canal si se confirma de nuevo
+        statuses = await self.outbox.send(bot, [
+            ('content', channel_id, payload, f"draft:{draft_id}:{channel_id}")
+            for channel_id, channel_name in channels
+        ])
+        
+        results = [(channel_id, channel_name, status) for (channel_id, channel_name), status in zip(channels, statuses)]
+        if all(status in ('sent', 'pending') for status in statuses):
+            await self.admin_bot.delete_message_draft(draft_id)
+        return results
+
+    async def publish_scheduled_draft(self, context: ContextTypes.DEFAULT_TYPE, draft_id):
+        """Publica un borrador programado cuando vence su send_at (ver DraftScheduler)"""
+        draft = await self.admin_bot.get_message_draft(draft_id)
+        if not draft or draft[-1] is None:
+            # Borrador eliminado o desprogramado después de armar el job
+            return
+        
+        results = await self.publish_draft(context.bot, draft)
+        failed = [channel_name for channel_id, channel_name, status in results if status not in ('sent', 'pending')]
+        if not results or failed:
+            # Error permanente: se conserva el borrador sin programar para no reintentarlo en cada arranque
+            await self.admin_bot.schedule_message_draft(draft_id, None)
+            print(f"No se pudo publicar el borrador programado {draft_id} en: {', '.join(failed) or draft[1]}")
+
+    async def select_schedule(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Muestra las opciones para programar la publicación del borrador"""
+        query = update.callback_query
+        if not query:
+            return
+        await query.answer()
+        
+        if context.user_data is None or not context.user_data.get('awaiting_confirmation'):
+            return
+        
+        channel_type = context.user_data['posting_channel']
+        title, reply_markup = MenuFactory.schedule_draft(f"admin_{channel_type}")
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
+
+    async def schedule_draft(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Programa el borrador con un retraso predefinido o pide la fecha exacta"""
+        query = update.callback_query
+        if not query:
+            return
+        await query.answer()
+        
+        if context.user_data is None or not context.user_data.get('awaiting_confirmation'):
+            return
+        
+        choice = context.args[0] if context.args else None
+        channel_type = context.user_data['posting_channel']
+        
+        if choice == 'custom':
+            context.user_data['awaiting_schedule_time'] = True
+            title, reply_markup = MenuFactory.create_simple_message(
+                "🕒 Programar Publicación",
+                "Envía la fecha y hora de publicación con el formato <code>AAAA-MM-DD HH:MM</code>\n"
+                f"(por ejemplo, <code>{format_timestamp(time.time() + 86400)}</code>).",
+                "schedule_options"
+            )
+            await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
+            return
+        
+        if not choice or not choice.isdigit():
+            return
+        
+        title, reply_markup = await self.confirm_schedule(context, int(time.time()) + int(choice))
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
+
+    async def handle_schedule_time_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Maneja la fecha y hora exactas de una publicación programada"""
+        # Se espera un único mensaje: ante un error se vuelve a las opciones de programación
+        context.user_data.pop('awaiting_schedule_time', None)
+        if not context.user_data.get('awaiting_confirmation'):
+            return
+        
+        if not update.message or not update.message.text:
+            return
+        
+        try:
+            send_at = int(datetime.strptime(update.message.text.strip(), '%Y-%m-%d %H:%M').timestamp())
+        except ValueError:
+            title, reply_markup = MenuFactory.create_simple_message(
+                "❌ Formato inválido",
+                "Usa AAAA-MM-DD HH:MM, por ejemplo "
+                f"<code>{format_timestamp(time.time() + 86400)}</code>.",
+                "schedule_options"
+            )
+            await update.message.reply_text(title, reply_markup=reply_markup, parse_mode='HTML')
+            return
+        
+        if send_at <= time.time():
+            title, reply_markup = MenuFactory.create_simple_message(
+                "❌ Fecha pasada",
+                "La fecha de publicación debe ser futura.",
+                "schedule_options"
+            )
+            await update.message.reply_text(title, reply_markup=reply_markup, parse_mode='HTML')
+            return
+        
+        title, reply_markup = await self.confirm_schedule(context, send_at)
+        await update.message.reply_text(title, reply_markup=reply_markup, parse_mode='HTML')
+
+    async def confirm_schedule(self, context: ContextTypes.DEFAULT_TYPE, send_at):
+        """
+        Programa el borrador en curso y termina el flujo de envío.
+        
+        Returns:
+            tuple: (texto, reply_markup) con el resultado
+        """
+        channel_type = context.user_data['posting_channel']
+        draft_id = context.user_data['draft_id']
+        
+        if not await self.draft_scheduler.schedule(draft_id, send_at):
+            context.user_data.pop('awaiting_schedule_time', None)
+            return MenuFactory.create_simple_message(
+                "❌ Error",
+                "No se pudo programar el mensaje. Verifica que el borrador exista y que la cola de trabajos esté disponible.",
+                f"admin_{channel_type}"
+            )
+        
+        for key in ['posting_channel', 'message_text', 'file_id', 'file_type', 'draft_id',
+                    'awaiting_confirmation', 'awaiting_schedule_time']:
+            context.user_data.pop(key, None)
+        
+        return MenuFactory.create_simple_message(
+            "🕒 Mensaje Programado",
+            f"El mensaje se publicará en el canal {channel_type.upper()} el {format_timestamp(send_at)}.",
+            f"admin_{channel_type}"
+        )
+
+    async def view_scheduled_drafts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Listado de publicaciones programadas: scheduled_drafts:<tipo de canal>"""
+        query = update.callback_query
+        if not query:
+            return
+        await query.answer()
+        
+        channel_type = context.args[0] if context.args and context.args[0] in ('vip', 'free') else 'vip'
+        drafts = [draft for draft in await self.admin_bot.get_scheduled_drafts() if draft[1] == channel_type]
+        title, reply_markup = MenuFactory.scheduled_drafts(drafts, channel_type, format_timestamp)
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
+
+    async def cancel_scheduled_draft(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Pide confirmación para cancelar una publicación programada: scheduled_draft:<draft_id>"""
+        query = update.callback_query
+        if not query:
+            return
+        await query.answer()
+        
+        if not context.args or not context.args[0].isdigit():
+            return
+        draft = await self.admin_bot.get_message_draft(int(context.args[0]))
+        
+        if not draft or draft[-1] is None:
+            title, reply_markup = MenuFactory.create_simple_message(
+                "❌ Error",
+                "La publicación ya no está programada (puede que ya se haya publicado).",
+                "admin_panel"
+            )
+            await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
+            return
+        
+        draft_id, channel_type, message_text, file_path, file_id, file_type, disable_downloads, created_at, send_at = draft
+        
+        title, reply_markup = MenuFactory.create_confirmation(
+            "🗑️ Cancelar Publicación",
+            f"<b>Canal:</b> {channel_type.upper()}\n"
+            f"<b>Fecha:</b> {format_timestamp(send_at)}\n"
+            f"<b>Archivo adjunto:</b> {f'Sí ({file_type})' if file_id else 'No'}\n\n"
+            f"<b>Texto del mensaje:</b>\n{message_text}\n\n"
+            "¿Deseas cancelar la publicación? <b>El borrador se eliminará.</b>",
+            encode_callback('confirm_cancel_scheduled_draft', draft_id),
+            encode_callback('scheduled_drafts', channel_type)
+        )
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
+
+    async def confirm_cancel_scheduled_draft(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Cancela una publicación programada y elimina su borrador"""
+        query = update.callback_query
+        if not query:
+            return
+        await query.answer()
+        
+        if not context.args or not context.args[0].isdigit():
+            return
+        draft_id = int(context.args[0])
+        draft = await self.admin_bot.get_message_draft(draft_id)
+        
+        if not draft or not await self.draft_scheduler.cancel(draft_id):
+            title, reply_markup = MenuFactory.create_simple_message(
+                "❌ Error",
+                "La publicación ya no está programada (puede que ya se haya publicado).",
+                "admin_panel"
+            )
+        else:
+            title, reply_markup = MenuFactory.create_simple_message(
+                "✅ Publicación Cancelada",
+                f"La publicación programada para el {format_timestamp(draft[-1])} fue cancelada y su borrador eliminado.",
+                encode_callback('scheduled_drafts', draft[1])
+            )
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
+
+    async def select_broadcast_audience(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Elige la audiencia para difundir el borrador confirmado por mensaje directo"""
+        query = update.callback_query
+        if not query:
+            return
+        await query.answer()
+        
+        if context.user_data is None or not context.user_data.get('awaiting_confirmation'):
+            return
+        
+        channel_type = context.user_data['posting_channel']
+        title, reply_markup = MenuFactory.broadcast_audience(f"admin_{channel_type}")
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
+
+    async def start_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Crea la difusión del borrador y la ejecuta en segundo plano"""
+        query = update.callback_query
+        if not query:
+            return
+        await query.answer()
+        
+        if context.user_data is None or not context.user_data.get('awaiting_confirmation'):
+            return
+        
+        audience = context.args[0] if context.args else None
+        if audience not in BroadcastWorker.AUDIENCES:
+            return
+        
+        channel_type = context.user_data['posting_channel']
+        draft_id = context.user_data['draft_id']
+        created = await self.broadcast_worker.create(draft_id, audience)
+        if not created:
+            title, reply_markup = MenuFactory.create_simple_message(
+                "❌ Error",
+                "No se pudo encontrar el borrador del mensaje.",
+                f"admin_{channel_type}"
+            )
+            await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
+            return
+        
+        broadcast_id, recipients = created
+        # El contenido ya se copió a la difusión
+        await self.admin_bot.delete_message_draft(draft_id)
+        for key in ['posting_channel', 'message_text', 'file_id', 'file_type', 'draft_id', 'awaiting_confirmation']:
+            context.user_data.pop(key, None)
+        
+        self.broadcast_worker.spawn(self.run_broadcast(context.bot, broadcast_id, query.message.chat_id if query.message else None))
+        
+        title, reply_markup = MenuFactory.create_simple_message(
+            "📣 Difusión Iniciada",
+            f"Enviando el mensaje a {recipients} suscriptores.\n"
+            "Recibirás un resumen al terminar.",
+            f"admin_{channel_type}"
+        )
+        await self.edit_menu(query, title, reply_markup=reply_markup, parse_mode='HTML')
+
+    async def run_broadcast(self, bot, broadcast_id, report_chat_id=None):
+        """Ejecuta una difusión y envía el resumen al administrador que la inició"""
+        try:
+            summary = await self.broadcast_worker.run(bot, broadcast_id)
+        except Exception as e:
+            print(f"Error en la difusión {broadcast_id}: {e}")
+            return
+        
+        if report_chat_id:
+            try:
+                await call_with_retry(
+                    bot.send_message,
+                    report_chat_id,
+                    f"📣 Difusión {broadcast_id} terminada\n\n"
+                    f"Enviados: {summary.get('sent', 0)}\n"
+                    f"Bloqueados: {summary.get('blocked', 0)}\n"
+                    f"Fallidos: {summary.get('failed', 0)}",
+                    limiter=self.limiter
+                )
+            except TelegramError as e:
+                print(f"Error enviando el resumen de la difusión {broadcast_id}: {e}")
+
+    async def refresh_bot_identity(self):
+        """Consulta get_me una vez y guarda la identidad del bot"""
+        self.bot_identity = await self.app.bot.get_me()
+        return self.bot_identity
+
+    async def get_bot_username(self, refresh=False):
+        """Username del bot para enlaces profundos, sin llamar a la API salvo que se pida refresh"""
+        if refresh or self.bot_identity is None:
+            await self.refresh_bot_identity()
+        return self.bot_identity.username
+
+    async def post_init(self, application: Application):
+        await self.refresh_bot_identity()
+        if application.job_queue:
+            await self.subscription_scheduler.start(application.job_queue)
+            await self.free_channel_handler.start(application)
+            await self.draft_scheduler.start(application.job_queue)
+        self.expulsion_worker.start(application)
+        self.broadcast_worker.start(application)
+        self.outbox.start(application)
+
+    async def post_shutdown(self, application: Application):
+        # Antes de cerrar el pool: guarda las solicitudes de ingreso aún en memoria
+        await self.free_channel_handler.stop()
+        self.outbox.stop()
+        await self.expulsion_worker.stop()
+        await self.broadcast_worker.stop()
+        self.admin_bot.close()
+
+    async def dispatch_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Despacha los botones inline; cualquier pulsación abandona la espera de una fecha de programación"""
+        if context.user_data is not None:
+            # schedule_draft:custom la vuelve a activar al despacharse
+            context.user_data.pop('awaiting_schedule_time', None)
+        return await self.callback_router.dispatch(update, context)
+
+    def create_callback_router(self):
+        """Tabla de acciones de los botones inline (ver callback_router.py)"""
+        return CallbackRouter({
+            'admin_panel': self.admin_panel,
+            'admin_vip': self.admin_vip,
+            'admin_free': self.admin_free,
+            'admin_stats': self.admin_stats,
+            'admin_config': self.admin_config,
+            'config_delay': self.config_delay,
+            'set_delay': self.set_delay,
+            'generate_vip_token': self.generate_vip_token,
+            'generate_token_rate': self.generate_token_for_rate,
+            'view_vip_users': self.view_vip_users,
+            'vip_users': self.view_vip_users,
+            'manage_channels': self.manage_channels,
+            'add_free_channel': self.add_free_channel,
+            'add_vip_channel': self.add_vip_channel,
+            'view_channels': self.view_channels,
+            
+            # Menús factory
+            'system_config': self.system_config,
+            'vip_management': self.vip_management,
+            'statistics': self.statistics,
+            
+            # Gestión de tarifas VIP
+            'manage_rates': self.manage_rates,
+            'select_rate_duration': self.select_rate_duration,
+            'rate_duration': self.handle_rate_duration,
+            'view_rates': self.view_rates,
+            'edit_rate': self.edit_rate,
+            'toggle_rate_status': self.toggle_rate_status,
+            'delete_rate': self.delete_rate,
+            'confirm_delete_rate': self.confirm_delete_rate,
+            'change_rate_name': self.change_rate_name,
+            'change_rate_duration': self.change_rate_duration,
+            'change_rate_cost': self.change_rate_cost,
+            
+            # Envío de mensajes a canales
+            'send_to_vip_channel': self.send_to_vip_channel,
+            'send_to_free_channel': self.send_to_free_channel,
+            'attach_file': self.handle_file_choice,
+            'no_file': self.handle_file_choice,
+            'disable_downloads': self.handle_download_restriction,
+            'allow_downloads': self.handle_download_restriction,
+            'confirm_send_message': self.handle_message_confirmation,
+            'edit_message': self.handle_message_confirmation,
+            'broadcast_audience': self.select_broadcast_audience,
+            'broadcast': self.start_broadcast,
+            'schedule_options': self.select_schedule,
+            'draft_channels': self.select_draft_channels,
+            'draft_preview': self.show_draft_preview,
+            'schedule_draft': self.schedule_draft,
+            'scheduled_drafts': self.view_scheduled_drafts,
+            'scheduled_draft': self.cancel_scheduled_draft,
+            'confirm_cancel_scheduled_draft': self.confirm_cancel_scheduled_draft,
+        })
 
     def run(self):
         if not self.token:
             raise ValueError("Bot token is not available")
-        self.app = Application.builder().token(self.token).build()
+        self.app = (
+            Application.builder()
+            .token(self.token)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
         
+        # Descarta las actualizaciones de no administradores antes de cualquier handler
+        self.app.add_handler(AdminGuard(self.admin_bot.admin_ids).handler(), group=AdminGuard.GROUP)
         self.app.add_handler(CommandHandler("start", self.start))
-        self.app.add_handler(CallbackQueryHandler(self.admin_panel, pattern="^admin_panel$"))
-        self.app.add_handler(CallbackQueryHandler(self.admin_vip, pattern="^admin_vip$"))
-        self.app.add_handler(CallbackQueryHandler(self.admin_free, pattern="^admin_free$"))
-        self.app.add_handler(CallbackQueryHandler(self.admin_stats, pattern="^admin_stats$"))
-        self.app.add_handler(CallbackQueryHandler(self.admin_config, pattern="^admin_config$"))
-        self.app.add_handler(CallbackQueryHandler(self.config_delay, pattern="^config_delay$"))
-        self.app.add_handler(CallbackQueryHandler(self.set_delay, pattern="^set_delay_"))
-        self.app.add_handler(CallbackQueryHandler(self.generate_vip_token, pattern="^generate_vip_token$"))
-        self.app.add_handler(CallbackQueryHandler(self.generate_token_for_rate, pattern="^generate_token_rate_"))
-        self.app.add_handler(CallbackQueryHandler(self.view_vip_users, pattern="^view_vip_users$"))
-        self.app.add_handler(CallbackQueryHandler(self.manage_channels, pattern="^manage_channels$"))
-        self.app.add_handler(CallbackQueryHandler(self.add_free_channel, pattern="^add_free_channel$"))
-        self.app.add_handler(CallbackQueryHandler(self.add_vip_channel, pattern="^add_vip_channel$"))
-        self.app.add_handler(CallbackQueryHandler(self.view_channels, pattern="^view_channels$"))
-        
-        # Nuevos handlers para menús factory
-        self.app.add_handler(CallbackQueryHandler(self.system_config, pattern="^system_config$"))
-        self.app.add_handler(CallbackQueryHandler(self.vip_management, pattern="^vip_management$"))
-        self.app.add_handler(CallbackQueryHandler(self.statistics, pattern="^statistics$"))
-        
-        # Handlers para gestión de tarifas VIP
-        self.app.add_handler(CallbackQueryHandler(self.manage_rates, pattern="^manage_rates$"))
-        self.app.add_handler(CallbackQueryHandler(self.select_rate_duration, pattern="^select_rate_duration$"))
-        self.app.add_handler(CallbackQueryHandler(self.handle_rate_duration, pattern="^rate_duration_"))
-        self.app.add_handler(CallbackQueryHandler(self.view_rates, pattern="^view_rates$"))
-        self.app.add_handler(CallbackQueryHandler(self.edit_rate, pattern="^edit_rate_"))
-        self.app.add_handler(CallbackQueryHandler(self.toggle_rate_status, pattern="^toggle_rate_status_"))
-        self.app.add_handler(CallbackQueryHandler(self.delete_rate, pattern="^delete_rate_"))
-        self.app.add_handler(CallbackQueryHandler(self.confirm_delete_rate, pattern="^confirm_delete_rate_"))
-        self.app.add_handler(CallbackQueryHandler(self.change_rate_name, pattern="^change_rate_name_"))
-        self.app.add_handler(CallbackQueryHandler(self.change_rate_duration, pattern="^change_rate_duration_"))
-        self.app.add_handler(CallbackQueryHandler(self.change_rate_cost, pattern="^change_rate_cost_"))
-        
-        # Handlers para envío de mensajes a canales
-        self.app.add_handler(CallbackQueryHandler(self.send_to_vip_channel, pattern="^send_to_vip_channel$"))
-        self.app.add_handler(CallbackQueryHandler(self.send_to_free_channel, pattern="^send_to_free_channel$"))
-        self.app.add_handler(CallbackQueryHandler(self.handle_file_choice, pattern="^(attach_file|no_file)$"))
-        self.app.add_handler(CallbackQueryHandler(self.handle_download_restriction, pattern="^(disable_downloads|allow_downloads)$"))
-        self.app.add_handler(CallbackQueryHandler(self.handle_message_confirmation, pattern="^(confirm_send_message|edit_message)$"))
-        
+        self.app.add_handler(CallbackQueryHandler(self.dispatch_callback))
+        self.app.add_handler(ChatJoinRequestHandler(self.free_channel_handler.handle_join_request))
         self.app.add_handler(MessageHandler(filters.FORWARDED, self.handle_forwarded_message))
         self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_text_input))
         self.app.add_handler(MessageHandler(filters.PHOTO | filters.VIDEO | filters.Document.ALL, self.handle_file_input))
         
-        job_queue = self.app.job_queue
-        if job_queue:
-            job_queue.run_repeating(self.check_subscriptions, interval=3600, first=10)
-        
         print("Bot iniciado...")
         self.app.run_polling()
 
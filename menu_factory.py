@@ -1,12 +1,45 @@
+import functools
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from callback_router import encode_callback
 
 class MenuFactory:
     """
     Factory para crear menús consistentes con navegación lineal.
     Todos los menús se muestran editando el mismo mensaje para mantener
     una pantalla de chat limpia.
+    
+    Los menús estáticos se construyen una sola vez (functools.cache): los
+    objetos de telegram son inmutables y pueden compartirse entre pulsaciones.
+    Los menús que dependen de datos se guardan junto a la versión de esos
+    datos (ver cached/store) y solo se reconstruyen cuando la versión cambia.
     """
     
+    # {nombre: (versión de los datos, (texto, reply_markup))}
+    _versioned_menus = {}
+    
+    @staticmethod
+    def cached(name, version):
+        """
+        Obtiene un menú dinámico si se construyó con la misma versión de datos.
+        
+        Args:
+            name (str): Nombre del menú
+            version: Versión actual de los datos del menú
+        
+        Returns:
+            tuple: (texto, reply_markup), o None si hay que reconstruirlo
+        """
+        entry = MenuFactory._versioned_menus.get(name)
+        if entry and entry[0] == version:
+            return entry[1]
+        return None
+    
+    @staticmethod
+    def store(name, version, menu):
+        """Guarda un menú dinámico construido con la versión de datos indicada y lo devuelve"""
+        MenuFactory._versioned_menus[name] = (version, menu)
+        return menu
+    
     @staticmethod
     def create_menu(title, options, back_callback=None):
         """
@@ -34,6 +67,7 @@ class MenuFactory:
         return title, reply_markup
     
     @staticmethod
+    @functools.cache
     def admin_panel():
         """Menú principal del administrador"""
         title = "<b>Panel de Administración</b>\n\nSelecciona una opción:"
@@ -48,6 +82,7 @@ class MenuFactory:
         return MenuFactory.create_menu(title, options)
     
     @staticmethod
+    @functools.cache
     def admin_vip():
         """Menú de gestión del canal VIP"""
         title = "<b>💎 Gestión del Canal VIP</b>\n\nSelecciona una opción:"
@@ -57,6 +92,7 @@ class MenuFactory:
             ("🔑 Generar Token", "vip_generate_token"),
             ("👥 Suscriptores", "vip_manage"),
             ("📝 Enviar publicación", "send_to_vip_channel"),
+            ("🕒 Publicaciones programadas", encode_callback('scheduled_drafts', 'vip')),
             ("⚙️ Configuración", "vip_config"),
             ("💋 Config Reacciones", "vip_config_reactions"),
             ("🔄 Actualizar", "admin_vip")
@@ -65,6 +101,7 @@ class MenuFactory:
         return MenuFactory.create_menu(title, options, "admin_panel")
     
     @staticmethod
+    @functools.cache
     def admin_free():
         """Menú de gestión del canal gratuito"""
         title = "<b>💬 Gestión del Canal Free</b>\n\nSelecciona una opción:"
@@ -73,6 +110,7 @@ class MenuFactory:
             ("⚙️ Configurar Canal", "configure_free_channel"),
             ("⏰ Tiempo Espera", "set_wait_time"),
             ("📝 Enviar publicación", "send_to_free_channel"),
+            ("🕒 Publicaciones programadas", encode_callback('scheduled_drafts', 'free')),
             ("⚡ Procesar Ahora", "process_pending_now"),
             ("🧹 Limpiar Antiguas", "cleanup_old_requests"),
             ("📊 Estadísticas", "free_channel_stats"),
@@ -83,6 +121,7 @@ class MenuFactory:
         return MenuFactory.create_menu(title, options, "admin_panel")
     
     @staticmethod
+    @functools.cache
     def admin_stats():
         """Menú de estadísticas generales"""
         title = "<b>📊 Estadísticas del Sistema</b>\n\nSelecciona una opción:"
@@ -97,6 +136,7 @@ class MenuFactory:
         return MenuFactory.create_menu(title, options, "admin_panel")
     
     @staticmethod
+    @functools.cache
     def admin_config():
         """Menú de estado de configuración"""
         title = "<b>⚙️ Estado de la Configuración</b>\n\nSelecciona una opción:"
@@ -109,6 +149,7 @@ class MenuFactory:
         return MenuFactory.create_menu(title, options, "admin_panel")
     
     @staticmethod
+    @functools.cache
     def system_config():
         """Menú de configuración del sistema"""
         title = "<b>Configuración del Sistema</b>\n\nSelecciona una opción:"
@@ -121,20 +162,22 @@ class MenuFactory:
         return MenuFactory.create_menu(title, options, "admin_panel")
     
     @staticmethod
+    @functools.cache
     def config_delay():
         """Menú para configurar delay del canal gratuito"""
         title = "<b>Configurar Delay del Canal Gratuito</b>\n\nSelecciona el tiempo de espera:"
         
         options = [
-            ("30 segundos", "set_delay_30"),
-            ("1 minuto", "set_delay_60"),
-            ("5 minutos", "set_delay_300"),
-            ("10 minutos", "set_delay_600")
+            ("30 segundos", encode_callback('set_delay', 30)),
+            ("1 minuto", encode_callback('set_delay', 60)),
+            ("5 minutos", encode_callback('set_delay', 300)),
+            ("10 minutos", encode_callback('set_delay', 600))
         ]
         
         return MenuFactory.create_menu(title, options, "system_config")
     
     @staticmethod
+    @functools.cache
     def manage_channels():
         """Menú de gestión de canales"""
         title = "<b>Gestión de Canales</b>\n\nSelecciona una opción:"
@@ -149,6 +192,43 @@ class MenuFactory:
         return MenuFactory.create_menu(title, options, "admin_panel")
     
     @staticmethod
+    def manage_channels_status(channels):
+        """Menú de gestión de canales con el estado de cada canal configurado"""
+        title, reply_markup = MenuFactory.manage_channels()
+        if channels:
+            channels_info = "\n<b>Canales Configurados:</b>\n"
+            for channel_id, channel_name, channel_type, is_active in channels:
+                status = "🟢 Activo" if is_active else "🔴 Inactivo"
+                channels_info += f"• {channel_name} ({channel_type.upper()}) - {status}\n"
+            title = title.replace("Selecciona una opción:", channels_info + "\nSelecciona una opción:")
+        return title, reply_markup
+    
+    @staticmethod
+    def view_channels_list(channels):
+        """Listado detallado de los canales configurados"""
+        if not channels:
+            return MenuFactory.create_simple_message(
+                "📋 Canales Configurados",
+                "No hay canales configurados.",
+                "manage_channels"
+            )
+        
+        message = ""
+        for channel_id, channel_name, channel_type, is_active in channels:
+            status = "🟢 Activo" if is_active else "🔴 Inactivo"
+            message += f"<b>{channel_name}</b>\n"
+            message += f"ID: <code>{channel_id}</code>\n"
+            message += f"Tipo: {channel_type.upper()}\n"
+            message += f"Estado: {status}\n\n"
+        
+        return MenuFactory.create_simple_message(
+            "📋 Canales Configurados",
+            message,
+            "manage_channels"
+        )
+    
+    @staticmethod
+    @functools.cache
     def vip_management():
         """Menú de gestión VIP"""
         title = "<b>Gestión VIP</b>\n\nSelecciona una opción:"
@@ -163,6 +243,7 @@ class MenuFactory:
         return MenuFactory.create_menu(title, options, "admin_panel")
     
     @staticmethod
+    @functools.cache
     def manage_rates():
         """Menú de gestión de tarifas VIP"""
         title = "<b>Gestión de Tarifas VIP</b>\n\nSelecciona una opción:"
@@ -175,15 +256,16 @@ class MenuFactory:
         return MenuFactory.create_menu(title, options, "vip_management")
     
     @staticmethod
+    @functools.cache
     def select_rate_duration():
         """Menú para seleccionar duración de tarifa"""
         title = "<b>Crear Tarifa - Paso 1</b>\n\nSelecciona la duración de la suscripción:"
         
         options = [
-            ("1 día", "rate_duration_1"),
-            ("1 semana (7 días)", "rate_duration_7"),
-            ("2 semanas (14 días)", "rate_duration_14"),
-            ("1 mes (30 días)", "rate_duration_30")
+            ("1 día", encode_callback('rate_duration', 1)),
+            ("1 semana (7 días)", encode_callback('rate_duration', 7)),
+            ("2 semanas (14 días)", encode_callback('rate_duration', 14)),
+            ("1 mes (30 días)", encode_callback('rate_duration', 30))
         ]
         
         return MenuFactory.create_menu(title, options, "manage_rates")
@@ -204,14 +286,183 @@ class MenuFactory:
             for rate_id, name, days, cost, is_active in rates:
                 status = "🟢" if is_active else "🔴"
                 button_text = f"{status} {name} - {days}d - ${cost:.2f}"
-                options.append((button_text, f"edit_rate_{rate_id}"))
+                options.append((button_text, encode_callback('edit_rate', rate_id)))
             
             # Agregar botón para crear nueva tarifa
             options.append(("➕ Crear Nueva Tarifa", "select_rate_duration"))
         
         return MenuFactory.create_menu(title, options, "manage_rates")
     
+    VIP_USER_FILTERS = (
+        ('all', "Todos"),
+        ('active', "Activos"),
+        ('expired', "Expirados"),
+    )
+    
+    @staticmethod
+    def vip_users_page(users, status_filter, has_prev, has_next, format_date=str):
+        """
+        Página del listado de usuarios VIP con filtros por estado y navegación.
+        
+        Args:
+            users (list): [(user_id, username, subscription_end, status), ...]
+            status_filter (str): Filtro actual ('all', 'active', 'expired')
+            has_prev (bool): Si existe una página anterior
+            has_next (bool): Si existe una página siguiente
+            format_date: Función para mostrar subscription_end
+        
+        Returns:
+            tuple: (texto, reply_markup)
+        """
+        if users:
+            message = ""
+            for user_id, username, sub_end, status in users:
+                message += f"👤 {username or f'ID: {user_id}'}\n"
+                message += f"   Estado: {status}\n"
+                message += f"   Vence: {format_date(sub_end)}\n\n"
+        else:
+            message = "No hay usuarios VIP registrados."
+        title = f"<b>👥 Usuarios VIP</b>\n\n{message}"
+        
+        keyboard = [[
+            InlineKeyboardButton(
+                f"• {label}" if value == status_filter else label,
+                callback_data=encode_callback('vip_users', value)
+            )
+            for value, label in MenuFactory.VIP_USER_FILTERS
+        ]]
+        
+        # Los botones llevan la clave (subscription_end, user_id) del borde de la página;
+        # un subscription_end NULL ordena como 0 (ver VIP_USERS_PAGE_SQL en bot.py)
+        navigation = []
+        if has_prev and users:
+            user_id, username, sub_end, status = users[0]
+            navigation.append(InlineKeyboardButton(
+                "◀️ Anterior", callback_data=encode_callback('vip_users', status_filter, 'prev', sub_end or 0, user_id)
+            ))
+        if has_next and users:
+            user_id, username, sub_end, status = users[-1]
+            navigation.append(InlineKeyboardButton(
+                "Siguiente ▶️", callback_data=encode_callback('vip_users', status_filter, 'next', sub_end or 0, user_id)
+            ))
+        if navigation:
+            keyboard.append(navigation)
+        
+        keyboard.append([InlineKeyboardButton("← Volver", callback_data="vip_management")])
+        return title, InlineKeyboardMarkup(keyboard)
+    
+    @staticmethod
+    @functools.cache
+    def broadcast_audience(back_callback):
+        """Menú para elegir la audiencia de una difusión por mensaje directo"""
+        title = "<b>📣 Difundir a Suscriptores</b>\n\nSelecciona a quién enviar el mensaje:"
+        
+        options = [
+            ("💎 VIP activos", encode_callback('broadcast', 'active')),
+            ("⏳ VIP que vencen en 24 horas", encode_callback('broadcast', 'expiring')),
+            ("⌛ VIP expirados", encode_callback('broadcast', 'expired'))
+        ]
+        
+        return MenuFactory.create_menu(title, options, back_callback)
+    
+    # Opciones de programación de una publicación: (etiqueta, segundos desde ahora)
+    SCHEDULE_DELAYS = (
+        ("🕐 En 1 hora", 3600),
+        ("🕒 En 3 horas", 3 * 3600),
+        ("🕕 En 6 horas", 6 * 3600),
+        ("🕛 En 12 horas", 12 * 3600),
+        ("📅 Mañana a esta hora", 86400),
+    )
+    
+    @staticmethod
+    @functools.cache
+    def schedule_draft(back_callback):
+        """Menú para elegir cuándo publicar el borrador en el canal"""
+        title = "<b>🕒 Programar Publicación</b>\n\nSelecciona cuándo publicar el mensaje en el canal:"
+        
+        options = [(label, encode_callback('schedule_draft', seconds)) for label, seconds in MenuFactory.SCHEDULE_DELAYS]
+        options.append(("✍️ Fecha y hora exactas", encode_callback('schedule_draft', 'custom')))
+        
+        return MenuFactory.create_menu(title, options, back_callback)
+    
+    @staticmethod
+    def scheduled_drafts(drafts, channel_type, format_date=str):
+        """
+        Listado de las publicaciones programadas de un canal.
+        
+        Args:
+            drafts (list): [(draft_id, channel_type, send_at), ...] ordenados por send_at
+            channel_type (str): Tipo de canal del listado ('vip', 'free')
+            format_date: Función para mostrar send_at
+        
+        Returns:
+            tuple: (texto, reply_markup)
+        """
+        if drafts:
+            title = "<b>🕒 Publicaciones Programadas</b>\n\nPulsa una publicación para cancelarla:"
+        else:
+            title = "<b>🕒 Publicaciones Programadas</b>\n\nNo hay publicaciones programadas."
+        
+        options = [
+            (f"🕒 {format_date(send_at)} (#{draft_id})", encode_callback('scheduled_draft', draft_id))
+            for draft_id, draft_channel_type, send_at in drafts
+        ]
+        return MenuFactory.create_menu(title, options, f"admin_{channel_type}")
+    
+    @staticmethod
+    def draft_channels(channels, selected_ids):
+        """
+        Menú para elegir los canales donde se publicará un borrador.
+        
+        Args:
+            channels (list): [(channel_id, channel_name, channel_type, is_active), ...]
+            selected_ids (set): IDs de los canales elegidos
+        """
+        title = "<b>📡 Canales de Destino</b>\n\nPulsa un canal para añadirlo o quitarlo de la publicación:"
+        
+        options = [
+            (f"{'✅' if channel_id in selected_ids else '⬜'} {channel_name} ({channel_type.upper()})",
+             encode_callback('draft_channels', channel_id))
+            for channel_id, channel_name, channel_type, is_active in channels if is_active
+        ]
+        options.append(("👁 Volver a la Vista Previa", "draft_preview"))
+        
+        return MenuFactory.create_menu(title, options)
+    
+    # Estado de cada canal tras publicar un borrador (estados de la cola outbox)
+    PUBLISH_STATUS_LABELS = {
+        'sent': "✅ Publicado",
+        'pending': "⏳ En cola, se reintentará automáticamente",
+        'blocked': "🚫 El bot no tiene permisos en el canal",
+        'dead': "❌ Error",
+    }
+    
+    @staticmethod
+    def publish_summary(results, back_callback, retry_callback=None):
+        """
+        Resumen de la publicación de un borrador en sus canales.
+        
+        Args:
+            results (list): [(channel_id, channel_name, status), ...]
+            back_callback (str): Callback para botón de volver
+            retry_callback (str, optional): Callback para reintentar los canales fallidos
+        """
+        if not results:
+            return MenuFactory.create_simple_message(
+                "❌ Error",
+                "No hay canales activos donde publicar el mensaje.",
+                back_callback
+            )
+        
+        message = ""
+        for channel_id, channel_name, status in results:
+            message += f"<b>{channel_name}</b>: {MenuFactory.PUBLISH_STATUS_LABELS.get(status, status)}\n"
+        
+        options = [("🔁 Reintentar Fallidos", retry_callback)] if retry_callback else []
+        return MenuFactory.create_menu(f"<b>📤 Resultado de la Publicación</b>\n\n{message}", options, back_callback)
+    
     @staticmethod
+    @functools.cache
     def statistics():
         """Menú de estadísticas"""
         title = "<b>Estadísticas del Sistema</b>\n\nSelecciona una opción:"
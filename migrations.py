@@ -0,0 +1,336 @@
+import sqlite3
+
+# Migraciones del esquema de la base de datos, aplicadas en orden según PRAGMA user_version.
+# Una migración publicada no se modifica: los cambios de esquema se añaden al final de MIGRATIONS.
+# Las bases de datos anteriores a este sistema tienen user_version 0; por eso cada migración
+# comprueba el estado actual antes de aplicarse y puede ejecutarse sobre un esquema parcial.
+
+def _columns(conn, table):
+    return {row[1]: row[2].upper() for row in conn.execute(f'PRAGMA table_info({table})')}
+
+def create_base_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS config (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vip_tokens (
+            token TEXT PRIMARY KEY,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            used BOOLEAN DEFAULT FALSE
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vip_users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            subscription_end TIMESTAMP,
+            status TEXT DEFAULT 'active'
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS free_channel_requests (
+            user_id INTEGER,
+            username TEXT,
+            requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed BOOLEAN DEFAULT FALSE,
+            PRIMARY KEY (user_id, requested_at)
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS channels (
+            channel_id INTEGER PRIMARY KEY,
+            channel_name TEXT,
+            channel_type TEXT CHECK(channel_type IN ('free', 'vip')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vip_rates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            days INTEGER NOT NULL,
+            cost REAL NOT NULL,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Antes se creaba en save_message_draft, con el primer borrador guardado
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS message_drafts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_type TEXT NOT NULL,
+            message_text TEXT NOT NULL,
+            file_path TEXT,
+            disable_downloads BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.execute("INSERT OR IGNORE INTO config (key, value) VALUES ('free_channel_delay', '60')")
+
+def add_token_duration(conn):
+    if 'duration_days' not in _columns(conn, 'vip_tokens'):
+        conn.execute('ALTER TABLE vip_tokens ADD COLUMN duration_days INTEGER DEFAULT 30')
+
+def add_request_chat_id(conn):
+    if 'chat_id' not in _columns(conn, 'free_channel_requests'):
+        conn.execute('ALTER TABLE free_channel_requests ADD COLUMN chat_id INTEGER')
+
+def create_vip_expulsions(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vip_expulsions (
+            user_id INTEGER,
+            channel_id INTEGER,
+            status TEXT DEFAULT 'pending',
+            error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, channel_id)
+        )
+    ''')
+
+# Conversión de columnas TIMESTAMP de texto a epoch: CURRENT_TIMESTAMP se guardaba en UTC,
+# mientras que subscription_end se guardaba como datetime.now() en hora local
+UTC_TEXT_TO_EPOCH = "CASE WHEN typeof({column}) = 'text' THEN CAST(strftime('%s', {column}) AS INTEGER) ELSE {column} END"
+LOCAL_TEXT_TO_EPOCH = "CASE WHEN typeof({column}) = 'text' THEN CAST(strftime('%s', {column}, 'utc') AS INTEGER) ELSE {column} END"
+
+EPOCH_TABLES = {
+    'vip_tokens': ('''
+        CREATE TABLE vip_tokens_new (
+            token TEXT PRIMARY KEY,
+            created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            used BOOLEAN DEFAULT FALSE,
+            duration_days INTEGER DEFAULT 30
+        )
+    ''', {'created_at': UTC_TEXT_TO_EPOCH}),
+    'vip_users': ('''
+        CREATE TABLE vip_users_new (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            joined_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            subscription_end INTEGER,
+            status TEXT DEFAULT 'active'
+        )
+    ''', {'joined_at': UTC_TEXT_TO_EPOCH, 'subscription_end': LOCAL_TEXT_TO_EPOCH}),
+    'free_channel_requests': ('''
+        CREATE TABLE free_channel_requests_new (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            username TEXT,
+            requested_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            processed BOOLEAN DEFAULT FALSE,
+            chat_id INTEGER,
+            UNIQUE (user_id, requested_at)
+        )
+    ''', {'requested_at': UTC_TEXT_TO_EPOCH}),
+}
+
+def convert_epoch_timestamps(conn):
+    # Reconstruir las tablas con columnas INTEGER epoch (segundos UTC)
+    for table, (table_sql, conversions) in EPOCH_TABLES.items():
+        columns = _columns(conn, table)
+        if all(columns.get(column) == 'INTEGER' for column in conversions):
+            continue
+
+        names = list(columns)
+        values = [conversions[name].format(column=name) if name in conversions else name for name in names]
+        conn.execute(table_sql)
+        conn.execute(f'''
+            INSERT INTO {table}_new ({', '.join(names)})
+            SELECT {', '.join(values)} FROM {table}
+        ''')
+        conn.execute(f'DROP TABLE {table}')
+        conn.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+
+def add_draft_file_columns(conn):
+    # La tabla de las bases de datos anteriores se creó sin las columnas de archivos de Telegram
+    columns = _columns(conn, 'message_drafts')
+    if 'file_id' not in columns:
+        conn.execute('ALTER TABLE message_drafts ADD COLUMN file_id TEXT')
+    if 'file_type' not in columns:
+        conn.execute('ALTER TABLE message_drafts ADD COLUMN file_type TEXT')
+
+def create_indexes(conn):
+    # Índices secundarios de las consultas frecuentes (ver HOT_QUERIES en bot.py)
+    for name in ('idx_vip_users_active_end', 'idx_free_requests_pending',
+                 'idx_channels_active_type', 'idx_vip_expulsions_pending'):
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
+
+    # vip_users usa idx_vip_users_status_end (migración 8) y channels se lee
+    # una sola vez al iniciar (ChannelRegistry): no necesitan índices propios
+    conn.execute('''
+        CREATE INDEX idx_free_requests_pending
+        ON free_channel_requests (requested_at) WHERE processed = FALSE
+    ''')
+    conn.execute('''
+        CREATE INDEX idx_vip_expulsions_pending
+        ON vip_expulsions (user_id) WHERE status = 'pending'
+    ''')
+    # Reemplaza el versionado de índices anterior guardado en config
+    conn.execute("DELETE FROM config WHERE key = 'index_version'")
+
+def create_vip_users_page_indexes(conn):
+    # Paginación por clave (subscription_end, user_id) del listado de usuarios VIP, con y sin filtro de estado
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_vip_users_end ON vip_users (subscription_end)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_vip_users_status_end ON vip_users (status, subscription_end)')
+
+def create_broadcasts(conn):
+    # Difusiones a suscriptores VIP: el contenido se copia del borrador y cada destinatario
+    # guarda su estado para poder reanudar el envío tras un reinicio
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY,
+            audience TEXT NOT NULL,
+            message_text TEXT NOT NULL,
+            file_id TEXT,
+            file_type TEXT,
+            disable_downloads BOOLEAN DEFAULT FALSE,
+            status TEXT DEFAULT 'running',
+            created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            finished_at INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            broadcast_id INTEGER,
+            user_id INTEGER,
+            status TEXT DEFAULT 'pending',
+            error TEXT,
+            PRIMARY KEY (broadcast_id, user_id)
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_pending
+        ON broadcast_recipients (broadcast_id, user_id) WHERE status = 'pending'
+    ''')
+
+def add_reminder_markers(conn):
+    # reminded_at: recordatorio enviado en el periodo actual; blocked_at: el usuario bloqueó al bot.
+    # register_vip_user reemplaza la fila al renovar, lo que reinicia ambas marcas
+    columns = _columns(conn, 'vip_users')
+    if 'reminded_at' not in columns:
+        conn.execute('ALTER TABLE vip_users ADD COLUMN reminded_at INTEGER')
+    if 'blocked_at' not in columns:
+        conn.execute('ALTER TABLE vip_users ADD COLUMN blocked_at INTEGER')
+
+def create_outbox(conn):
+    # Cola persistente de mensajes salientes: status 'pending', 'sent', 'blocked' o 'dead'
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY,
+            idempotency_key TEXT UNIQUE,
+            kind TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            last_error TEXT,
+            created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            sent_at INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_outbox_pending
+        ON outbox (next_attempt_at) WHERE status = 'pending'
+    ''')
+
+def add_draft_schedule(conn):
+    # send_at: publicación programada del borrador (epoch); NULL si no está programado
+    if 'send_at' not in _columns(conn, 'message_drafts'):
+        conn.execute('ALTER TABLE message_drafts ADD COLUMN send_at INTEGER')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_message_drafts_scheduled
+        ON message_drafts (send_at) WHERE send_at IS NOT NULL
+    ''')
+
+def create_draft_channels(conn):
+    # Canales de destino elegidos para un borrador; sin filas, se publica en el canal de su tipo
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS draft_channels (
+            draft_id INTEGER,
+            channel_id INTEGER,
+            PRIMARY KEY (draft_id, channel_id)
+        )
+    ''')
+
+def drop_vip_users_active_end_index(conn):
+    # Las consultas frecuentes sobre vip_users usan idx_vip_users_status_end;
+    # este índice solo encarecía cada escritura
+    conn.execute('DROP INDEX IF EXISTS idx_vip_users_active_end')
+
+def drop_channels_active_type_index(conn):
+    # Ninguna consulta frecuente lee channels: ChannelRegistry la carga una vez al iniciar
+    conn.execute('DROP INDEX IF EXISTS idx_channels_active_type')
+
+def create_vip_users_page_expression_indexes(conn):
+    # La paginación ordena por COALESCE(subscription_end, 0) para incluir las filas sin fecha;
+    # idx_vip_users_status_end se conserva para expiraciones y difusiones
+    conn.execute('DROP INDEX IF EXISTS idx_vip_users_end')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_vip_users_page ON vip_users (COALESCE(subscription_end, 0))')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_vip_users_status_page
+        ON vip_users (status, COALESCE(subscription_end, 0))
+    ''')
+
+MIGRATIONS = [
+    (1, create_base_schema),
+    (2, add_token_duration),
+    (3, add_request_chat_id),
+    (4, create_vip_expulsions),
+    (5, convert_epoch_timestamps),
+    (6, add_draft_file_columns),
+    (7, create_indexes),
+    (8, create_vip_users_page_indexes),
+    (9, create_broadcasts),
+    (10, add_reminder_markers),
+    (11, create_outbox),
+    (12, add_draft_schedule),
+    (13, create_draft_channels),
+    (14, drop_vip_users_active_end_index),
+    (15, drop_channels_active_type_index),
+    (16, create_vip_users_page_expression_indexes),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn):
+    """
+    Aplica las migraciones pendientes y actualiza PRAGMA user_version.
+    Debe llamarse dentro de una transacción: user_version forma parte de ella,
+    de modo que una migración fallida no deja la versión adelantada.
+
+    Args:
+        conn (sqlite3.Connection): Conexión con una transacción abierta
+
+    Returns:
+        list: Números de las migraciones aplicadas
+    """
+    version = get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise sqlite3.DatabaseError(
+            f"La base de datos tiene la versión de esquema {version}, "
+            f"posterior a la soportada ({SCHEMA_VERSION})"
+        )
+
+    applied = []
+    for number, migration in MIGRATIONS:
+        if number <= version:
+            continue
+        migration(conn)
+        conn.execute(f'PRAGMA user_version = {number}')
+        applied.append(number)
+    return applied
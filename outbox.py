@@ -0,0 +1,169 @@
+import asyncio
+import math
+import time
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from bot import send_content
+from throttling import call_with_retry
+
+class OutboxDispatcher:
+    """
+    Envía los mensajes de la cola persistente `outbox`. Cada mensaje se guarda
+    antes del primer intento, de modo que un error de la API o un reinicio no
+    lo pierde: los errores transitorios se reintentan con espera exponencial,
+    los permanentes se descartan (dead-letter) y una clave de idempotencia
+    evita encolar dos veces el mismo envío. Los envíos pasan por un token
+    bucket global, lo que suaviza las ráfagas.
+
+    Tipos de mensaje (kind):
+        'content': send_content(bot, chat_id, **payload)
+        'message': bot.send_message(chat_id, **payload)
+    """
+
+    BATCH_SIZE = 100
+    # Segundos que un mensaje reservado queda fuera de la cola mientras se envía
+    LEASE = 300
+    # Segundos que se conservan los mensajes enviados
+    RETENTION = 7 * 86400
+
+    def __init__(self, admin_bot, limiter, concurrency=8, max_attempts=8, base_delay=5, max_delay=3600):
+        """
+        Args:
+            admin_bot (AsyncAdminBot): Acceso asíncrono a la base de datos
+            limiter (TokenBucket): Limitador global de tasa compartido con el resto de envíos
+            concurrency (int): Envíos simultáneos
+            max_attempts (int): Intentos antes de descartar un mensaje
+            base_delay (float): Espera tras el primer error transitorio (se duplica en cada intento)
+            max_delay (float): Espera máxima entre intentos
+        """
+        self.admin_bot = admin_bot
+        self.concurrency = concurrency
+        self.limiter = limiter
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._purged_at = 0
+
+    def start(self, application):
+        """Lanza el bucle del dispatcher, que reanuda los mensajes pendientes de antes del reinicio"""
+        # Tarea propia y no de la aplicación: Application.stop() espera a las tareas de
+        # create_task y este bucle no termina; stop() la cancela al apagar el bot
+        self._task = asyncio.get_running_loop().create_task(self.run(application.bot))
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def wake(self):
+        """Despierta al dispatcher para que recalcule el próximo envío"""
+        self._wakeup.set()
+
+    async def send(self, bot, messages):
+        """
+        Encola mensajes y los intenta enviar de inmediato.
+
+        Args:
+            bot (Bot): Bot de Telegram
+            messages (list): [(kind, chat_id, payload, idempotency_key), ...]
+
+        Returns:
+            list: Estado de cada mensaje tras el intento ('sent', 'pending', 'blocked' o 'dead')
+        """
+        ids = await self.admin_bot.enqueue_outbox(messages)
+        statuses = await self.deliver(bot, ids)
+        return [statuses.get(message_id) for message_id in ids]
+
+    async def deliver(self, bot, ids):
+        """
+        Intenta enviar ahora los mensajes indicados que sigan pendientes.
+        Los que fallen con un error transitorio quedan en la cola para el dispatcher.
+
+        Returns:
+            dict: {id: status} de los mensajes indicados
+        """
+        messages = await self.admin_bot.claim_outbox(self.LEASE, ids=ids)
+        await self._dispatch(bot, messages)
+        statuses = await self.admin_bot.get_outbox_statuses(ids)
+        if 'pending' in statuses.values():
+            self.wake()
+        return statuses
+
+    async def run(self, bot):
+        while True:
+            try:
+                timeout = await self.drain(bot)
+            except Exception as e:
+                print(f"Error procesando la cola de mensajes: {e}")
+                timeout = self.base_delay
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain(self, bot):
+        """
+        Envía lotes de mensajes vencidos hasta vaciar la cola.
+
+        Returns:
+            float: Segundos hasta el próximo reintento, o None si la cola está vacía
+        """
+        while True:
+            messages = await self.admin_bot.claim_outbox(self.LEASE, self.BATCH_SIZE)
+            await self._dispatch(bot, messages)
+            if len(messages) < self.BATCH_SIZE:
+                break
+
+        if time.time() - self._purged_at > 3600:
+            await self.admin_bot.purge_outbox(int(time.time()) - self.RETENTION)
+            self._purged_at = time.time()
+
+        next_attempt_at = await self.admin_bot.get_next_outbox_time()
+        if next_attempt_at is None:
+            return None
+        return max(0.0, next_attempt_at - time.time())
+
+    async def _dispatch(self, bot, messages):
+        if not messages:
+            return []
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(message):
+            async with semaphore:
+                return await self._send(bot, *message)
+
+        results = await asyncio.gather(*(send(message) for message in messages))
+        await self.admin_bot.record_outbox_results(results)
+        return results
+
+    async def _send(self, bot, message_id, kind, chat_id, payload, attempts):
+        try:
+            if kind == 'content':
+                await call_with_retry(send_content, bot, chat_id, **payload, limiter=self.limiter, max_retries=0)
+            else:
+                await call_with_retry(bot.send_message, chat_id, **payload, limiter=self.limiter, max_retries=0)
+            return (message_id, 'sent', None, None, True)
+        except RetryAfter as e:
+            # Límite global de Telegram: frena al resto de envíos del limitador compartido
+            # y reprograma el mensaje sin contar el intento, que no es un fallo suyo
+            retry_after = float(e.retry_after)
+            self.limiter.pause(retry_after)
+            return (message_id, 'pending', str(e), math.ceil(time.time() + retry_after), False)
+        except Forbidden as e:
+            # El usuario bloqueó al bot o el bot ya no pertenece al canal
+            return (message_id, 'blocked', str(e), None, True)
+        except BadRequest as e:
+            print(f"Mensaje {message_id} descartado para {chat_id}: {e}")
+            return (message_id, 'dead', str(e), None, True)
+        except Exception as e:
+            if attempts + 1 >= self.max_attempts:
+                print(f"Mensaje {message_id} descartado para {chat_id} tras {attempts + 1} intentos: {e}")
+                return (message_id, 'dead', str(e), None, True)
+
+            delay = min(self.max_delay, self.base_delay * (2 ** attempts))
+            if not isinstance(e, TelegramError):
+                print(f"Error enviando mensaje {message_id} a {chat_id}: {e}")
+            return (message_id, 'pending', str(e), int(time.time() + delay), True)
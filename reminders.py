@@ -0,0 +1,57 @@
+from bot import format_timestamp
+
+class ReminderSender:
+    """
+    Envía los recordatorios de vencimiento VIP a través de la cola `outbox`,
+    que los entrega concurrentemente bajo su limitador global y reintenta los
+    errores transitorios. Cada recordatorio se reserva en vip_users
+    (reminded_at) y se encola en la misma transacción, de modo que un usuario
+    lo recibe una sola vez por periodo; la cola marca (blocked_at) a los
+    usuarios que bloquearon al bot para no volver a intentarlo. Solo se escribe
+    en la base de datos, así que el planificador puede esperar a send() y
+    reintentar si falla.
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self, admin_bot, outbox):
+        """
+        Args:
+            admin_bot (AsyncAdminBot): Acceso asíncrono a la base de datos
+            outbox (OutboxDispatcher): Cola de mensajes salientes
+        """
+        self.admin_bot = admin_bot
+        self.outbox = outbox
+
+    async def send(self, reminders):
+        """
+        Encola los recordatorios indicados que aún no se hayan enviado en este
+        periodo y despierta a la cola para que los entregue.
+
+        Args:
+            reminders (list): [(user_id, subscription_end), ...]
+
+        Returns:
+            int: Recordatorios encolados
+        """
+        queued = 0
+        for start in range(0, len(reminders), self.BATCH_SIZE):
+            ids = await self.admin_bot.enqueue_reminders([
+                (user_id, subscription_end,
+                 ('message', user_id, {'text': self._text(subscription_end)},
+                  f"reminder:{user_id}:{subscription_end}"))
+                for user_id, subscription_end in reminders[start:start + self.BATCH_SIZE]
+            ])
+            queued += len(ids)
+
+        if queued:
+            self.outbox.wake()
+            print(f"Recordatorios de vencimiento VIP encolados: {queued}")
+        return queued
+
+    def _text(self, subscription_end):
+        return (
+            f"¡Recordatorio! Tu suscripción VIP expira en menos de 24 horas.\n"
+            f"Fecha de expiración: {format_timestamp(subscription_end)}\n\n"
+            f"Renueva tu suscripción para mantener el acceso al canal VIP."
+        )
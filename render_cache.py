@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from telegram.error import BadRequest
+
+class RenderCache:
+    """
+    Último contenido mostrado en cada mensaje de menú, identificado por
+    (chat_id, message_id). Permite omitir las ediciones que no cambian nada,
+    como los botones "🔄 Actualizar", que de otro modo cuestan una llamada a
+    la API y terminan en el error "message is not modified".
+    """
+
+    def __init__(self, max_entries=1000):
+        """
+        Args:
+            max_entries (int): Mensajes recordados; se descartan los menos usados
+        """
+        self.max_entries = max_entries
+        self._digests = OrderedDict()
+
+    @staticmethod
+    def digest(text, reply_markup=None, parse_mode=None):
+        # Los objetos de telegram son inmutables y hashables por su contenido
+        return hash((text, parse_mode, reply_markup))
+
+    def is_current(self, key, digest):
+        if self._digests.get(key) != digest:
+            return False
+        self._digests.move_to_end(key)
+        return True
+
+    def remember(self, key, digest):
+        self._digests[key] = digest
+        self._digests.move_to_end(key)
+        while len(self._digests) > self.max_entries:
+            self._digests.popitem(last=False)
+
+    async def edit(self, query, text, reply_markup=None, parse_mode=None):
+        """
+        Edita el mensaje del callback solo si el contenido cambió.
+
+        Args:
+            query (CallbackQuery): Callback cuyo mensaje se edita
+            text (str): Texto del menú
+            reply_markup (InlineKeyboardMarkup, optional): Teclado del menú
+            parse_mode (str, optional): Modo de formato del texto
+
+        Returns:
+            bool: True si se llamó a la API de Telegram
+        """
+        message = query.message
+        if message is None:
+            # Mensajes inline: sin chat_id/message_id no se pueden identificar
+            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+            return True
+
+        key = (message.chat_id, message.message_id)
+        digest = self.digest(text, reply_markup, parse_mode)
+        if self.is_current(key, digest):
+            return False
+
+        try:
+            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+        except BadRequest as e:
+            # El mensaje ya mostraba este contenido (p. ej. tras un reinicio del bot)
+            if 'not modified' not in str(e).lower():
+                raise
+        self.remember(key, digest)
+        return True
@@ -0,0 +1,139 @@
+import heapq
+import time
+
+REMINDER = 'reminder'
+EXPIRY = 'expiry'
+
+class SubscriptionScheduler:
+    """
+    Planificador preciso de recordatorios y expiraciones VIP.
+    Mantiene los próximos vencimientos en un min-heap y arma un único job
+    run_once para el más cercano, de modo que cada suscripción se procesa
+    exactamente en su fecha límite sin recorrer periódicamente vip_users.
+    """
+
+    JOB_NAME = 'subscription_scheduler'
+    # Segundos antes de reintentar un recordatorio o una expiración que no se aplicó
+    RETRY_DELAY = 30
+
+    def __init__(self, admin_bot, reminder_before=86400, on_reminders=None, on_expired=None):
+        """
+        Args:
+            admin_bot (AsyncAdminBot): Acceso asíncrono a la base de datos
+            reminder_before (int): Segundos de antelación del recordatorio respecto al vencimiento
+            on_reminders: Corrutina (context, [(user_id, subscription_end), ...]) para enviar recordatorios
+            on_expired: Corrutina (context, [user_id, ...]) con los usuarios que acaban de expirar
+        """
+        self.admin_bot = admin_bot
+        self.reminder_before = reminder_before
+        self.on_reminders = on_reminders
+        self.on_expired = on_expired
+        self.job_queue = None
+        self._heap = []
+        # Vencimiento vigente por usuario; las entradas del heap que no coinciden están obsoletas
+        self._deadlines = {}
+        self._job = None
+        self._armed_at = None
+
+    async def start(self, job_queue):
+        """
+        Reconstruye el heap desde la base de datos y arma el primer job.
+
+        Args:
+            job_queue (JobQueue): Cola de trabajos de la aplicación
+        """
+        self.job_queue = job_queue
+        for user_id, username, subscription_end in await self.admin_bot.get_active_vip_subscriptions():
+            self._push(user_id, subscription_end)
+        self._arm()
+
+    def schedule(self, user_id, subscription_end):
+        """
+        Registra (o reemplaza) el vencimiento de un usuario.
+
+        Args:
+            user_id (int): ID del usuario VIP
+            subscription_end (int): Fin de la suscripción (epoch)
+        """
+        self._push(user_id, subscription_end)
+        self._arm()
+
+    def _push(self, user_id, subscription_end):
+        self._deadlines[user_id] = subscription_end
+        reminder_at = subscription_end - self.reminder_before
+        if subscription_end > time.time():
+            heapq.heappush(self._heap, (reminder_at, REMINDER, user_id, subscription_end))
+        heapq.heappush(self._heap, (subscription_end, EXPIRY, user_id, subscription_end))
+
+    def _discard_stale(self):
+        while self._heap and self._deadlines.get(self._heap[0][2]) != self._heap[0][3]:
+            heapq.heappop(self._heap)
+
+    def _arm(self):
+        if not self.job_queue:
+            return
+        self._discard_stale()
+        next_at = self._heap[0][0] if self._heap else None
+        if next_at == self._armed_at:
+            return
+
+        if self._job:
+            self._job.schedule_removal()
+            self._job = None
+        self._armed_at = next_at
+        if next_at is not None:
+            delay = max(0.0, next_at - time.time())
+            self._job = self.job_queue.run_once(self._run_due, when=delay, name=self.JOB_NAME)
+
+    async def _run_due(self, context):
+        self._job = None
+        self._armed_at = None
+        now = time.time()
+        reminders = []
+        expiring = {}
+
+        # Las entradas extraídas siguen en _deadlines hasta procesarse: si algo falla se reintentan
+        while self._heap and self._heap[0][0] <= now:
+            deadline, kind, user_id, subscription_end = heapq.heappop(self._heap)
+            if self._deadlines.get(user_id) != subscription_end:
+                continue
+            if kind == REMINDER:
+                reminders.append((user_id, subscription_end))
+            else:
+                expiring[user_id] = subscription_end
+
+        failed = []
+        try:
+            if reminders and self.on_reminders:
+                try:
+                    await self.on_reminders(context, reminders)
+                except Exception as e:
+                    print(f"Error enviando recordatorios VIP: {e}")
+                    failed += [(REMINDER, user_id, subscription_end) for user_id, subscription_end in reminders]
+
+            if expiring:
+                try:
+                    # Mismo instante que el heap: toda entrada extraída cumple subscription_end <= now
+                    expired_user_ids = await self.admin_bot.expire_old_subscriptions(now)
+                    still_active = await self.admin_bot.get_active_subscription_ends(set(expiring) - set(expired_user_ids))
+                except Exception as e:
+                    print(f"Error expirando suscripciones VIP: {e}")
+                    failed += [(EXPIRY, user_id, subscription_end) for user_id, subscription_end in expiring.items()]
+                else:
+                    for user_id, subscription_end in expiring.items():
+                        if self._deadlines.get(user_id) != subscription_end:
+                            # Renovado mientras tanto: schedule() ya registró el nuevo vencimiento
+                            continue
+                        if still_active.get(user_id) == subscription_end:
+                            # Sigue activo pese a haber vencido: se reintenta su expiración
+                            heapq.heappush(self._heap, (max(subscription_end, now + self.RETRY_DELAY), EXPIRY, user_id, subscription_end))
+                        else:
+                            del self._deadlines[user_id]
+
+                    if expired_user_ids and self.on_expired:
+                        await self.on_expired(context, expired_user_ids)
+        finally:
+            for kind, user_id, subscription_end in failed:
+                if self._deadlines.get(user_id) == subscription_end:
+                    heapq.heappush(self._heap, (now + self.RETRY_DELAY, kind, user_id, subscription_end))
+            self._arm()
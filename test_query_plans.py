@@ -0,0 +1,27 @@
+import pytest
+import bot
+from bot import AdminBot, HOT_QUERIES
+
+@pytest.fixture
+def admin_bot(tmp_path, monkeypatch):
+    # AdminBot lee DATABASE_PATH al construirse y aplica todas las migraciones
+    monkeypatch.setenv('DATABASE_PATH', str(tmp_path / 'test.sqlite'))
+    admin_bot = AdminBot()
+    yield admin_bot
+    admin_bot.db.close()
+
+def is_table_scan(detail):
+    return detail.startswith('SCAN') and 'INDEX' not in detail
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_index(admin_bot, name):
+    details = admin_bot.explain_hot_queries()[name]
+    assert not [detail for detail in details if is_table_scan(detail)], details
+
+def test_verify_query_plans_passes(admin_bot):
+    admin_bot.verify_query_plans()
+
+def test_verify_query_plans_detects_table_scan(admin_bot, monkeypatch):
+    monkeypatch.setitem(bot.HOT_QUERIES, 'unindexed', ('SELECT * FROM vip_users WHERE username = ?', ('x',)))
+    with pytest.raises(RuntimeError, match='unindexed'):
+        admin_bot.verify_query_plans()
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+class TokenBucket:
+    """
+    Limitador de tasa asíncrono (token bucket) compartido entre tareas.
+    Permite ráfagas de hasta `capacity` llamadas y un ritmo sostenido de
+    `rate` llamadas por segundo, por debajo de los límites de Telegram.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate (float): Tokens repuestos por segundo
+            capacity (int, optional): Tamaño máximo de ráfaga (por defecto, rate)
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, tokens=1):
+        """Espera hasta disponer de `tokens` y los consume"""
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+    def pause(self, seconds):
+        """
+        Vacía el bucket para frenar a todas las tareas al menos `seconds` (p. ej. tras
+        un RetryAfter). Varias pausas simultáneas no se acumulan.
+        """
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+async def call_with_retry(func, *args, limiter=None, max_retries=3, base_delay=1.0, global_backoff=True, **kwargs):
+    """
+    Llama a un método de la API de Telegram respetando el limitador y reintentando
+    ante RetryAfter (esperando lo que indique Telegram) y errores de red transitorios
+    (con espera exponencial).
+
+    Args:
+        func: Corrutina de la API de Telegram (p. ej. bot.send_message)
+        limiter (TokenBucket, optional): Limitador global de tasa
+        max_retries (int): Reintentos máximos antes de propagar el error
+        base_delay (float): Espera inicial para errores de red
+        global_backoff (bool): Ante RetryAfter, frenar a todas las tareas del limitador;
+            si es False solo espera la tarea que lo recibió (límite por chat)
+
+    Returns:
+        El resultado de la llamada
+    """
+    attempt = 0
+    while True:
+        if limiter:
+            await limiter.acquire()
+        try:
+            return await func(*args, **kwargs)
+        except RetryAfter as e:
+            if attempt >= max_retries:
+                raise
+            retry_after = float(e.retry_after)
+            if limiter and global_backoff:
+                # El siguiente acquire() esperará lo indicado por Telegram, igual que el resto de tareas
+                limiter.pause(retry_after)
+            else:
+                await asyncio.sleep(retry_after)
+        except BadRequest:
+            # BadRequest hereda de NetworkError pero no es transitorio
+            raise
+        except (TimedOut, NetworkError):
+            if attempt >= max_retries:
+                raise
+            await asyncio.sleep(base_delay * (2 ** attempt))
+        attempt += 1